@@ -0,0 +1,239 @@
+import os
+
+# Tudo roda em CPU: esconde GPUs antes de o torch ser importado
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "")
+
+import json
+import platform
+import sys
+import time
+
+import gymnasium as gym
+import numpy as np
+from gymnasium import spaces
+from stable_baselines3.common.vec_env.stacked_observations import StackedObservations
+
+from car_racing_env import CustomCarRacingWrapper, SpacesOnlyEnv, car_racing_action_space, rollout_buffer_config
+from config import N_ENVS, N_STACK, NATIVE_RENDER, PREPROCESSING
+
+# --- Suíte de benchmarks dos caminhos quentes do treinamento ---
+# Cada estágio é medido isoladamente. Os resultados vão para um JSON que pode
+# servir de baseline; no modo de comparação, métricas que pioraram além da
+# tolerância são apontadas como regressão (e o processo sai com código 1).
+BASELINE_PATH = "benchmarks/baseline.json"
+DEFAULT_TOLERANCE = 0.10
+
+
+def _metric(value, unit, higher_is_better):
+    return {"value": float(value), "unit": unit, "higher_is_better": higher_is_better}
+
+
+def _time_per_call(fn, n_calls, warmup=3):
+    for _ in range(warmup):
+        fn()
+    start = time.perf_counter()
+    for _ in range(n_calls):
+        fn()
+    return (time.perf_counter() - start) / n_calls
+
+
+def _training_observation_space():
+    # Formato das observações que chegam à CnnPolicy com a configuração atual
+    if NATIVE_RENDER is not None:
+        size = NATIVE_RENDER.get("size", 64)
+        frame_shape = (size, size, 1 if NATIVE_RENDER.get("grayscale", True) else 3)
+    elif PREPROCESSING is None:
+        frame_shape = (96, 96, 3)
+    else:
+        size = PREPROCESSING.get("size") or 96
+        frame_shape = (size, size, 1 if PREPROCESSING.get("grayscale") else 3)
+    return frame_shape, spaces.Box(0, 255, shape=(*frame_shape[:2], frame_shape[2] * N_STACK), dtype=np.uint8)
+
+
+def bench_env(n_steps=500, n_resets=10, seed=0):
+    from native_render import LowResRenderWrapper
+
+    results = {}
+    for name in ("raw", "wrapped", "native"):
+        env = gym.make("CarRacing-v3", continuous=True, render_mode="rgb_array")
+        if name == "native":
+            env = LowResRenderWrapper(env, **(NATIVE_RENDER or {}))
+        elif name == "wrapped":
+            env = CustomCarRacingWrapper(env, off_track_detection="pixel")
+        env.action_space.seed(seed)
+        action = env.action_space.sample()
+
+        start = time.perf_counter()
+        for i in range(n_resets):
+            env.reset(seed=seed + i)
+        reset_time = (time.perf_counter() - start) / n_resets
+
+        env.reset(seed=seed)
+        start = time.perf_counter()
+        for _ in range(n_steps):
+            _, _, terminated, truncated, _ = env.step(action)
+            if terminated or truncated:
+                env.reset()
+        step_time = (time.perf_counter() - start) / n_steps
+        env.close()
+
+        if name == "raw":
+            results["env_step_rate"] = _metric(1.0 / step_time, "steps/s", True)
+            results["env_reset_rate"] = _metric(1.0 / reset_time, "resets/s", True)
+            raw_step_time = step_time
+        elif name == "native":
+            results["native_render_step_rate"] = _metric(1.0 / step_time, "steps/s", True)
+        else:
+            results["wrapper_step_overhead"] = _metric(max(step_time - raw_step_time, 0.0) * 1e6, "us/step", False)
+    return results
+
+
+def bench_frame_stack(n_envs=N_ENVS, n_calls=2000):
+    frame_shape, _ = _training_observation_space()
+    frame_space = spaces.Box(0, 255, shape=frame_shape, dtype=np.uint8)
+    stacked = StackedObservations(n_envs, N_STACK, frame_space)
+    obs = np.stack([frame_space.sample() for _ in range(n_envs)])
+    dones = np.zeros(n_envs, dtype=bool)
+    infos = [{} for _ in range(n_envs)]
+    stacked.reset(obs)
+    per_call = _time_per_call(lambda: stacked.update(obs, dones, infos), n_calls)
+    return {"frame_stack_update": _metric(per_call * 1e6, "us/call", False)}
+
+
+def _make_policy():
+    from stable_baselines3.common.policies import ActorCriticCnnPolicy
+    from stable_baselines3.common.vec_env import VecTransposeImage
+
+    # A CnnPolicy recebe as observações com os canais primeiro (VecTransposeImage do PPO)
+    observation_space = VecTransposeImage.transpose_space(_training_observation_space()[1])
+    action_space = car_racing_action_space()
+    policy = ActorCriticCnnPolicy(observation_space, action_space, lr_schedule=lambda _: 3e-4)
+    return policy, observation_space, action_space
+
+
+def bench_inference(max_batch=N_ENVS, n_calls=50):
+    import torch
+
+    policy, observation_space, _ = _make_policy()
+    policy.set_training_mode(False)
+    results = {}
+    batch_size = 1
+    while batch_size <= max_batch:
+        obs = np.stack([observation_space.sample() for _ in range(batch_size)])
+        with torch.no_grad():
+            per_call = _time_per_call(lambda: policy.predict(obs, deterministic=True), n_calls)
+        results[f"inference_latency_b{batch_size}"] = _metric(per_call * 1e3, "ms", False)
+        batch_size *= 2
+    return results
+
+
+def bench_ppo_update(n_envs=4, n_steps=2048, batch_size=64, n_epochs=10):
+    import torch
+    from stable_baselines3 import PPO
+    from stable_baselines3.common.logger import configure
+    from stable_baselines3.common.vec_env import DummyVecEnv
+
+    _, observation_space = _training_observation_space()
+    action_space = car_racing_action_space()
+    vec_env = DummyVecEnv([lambda: SpacesOnlyEnv(observation_space, action_space)] * n_envs)
+    # Mesmo rollout buffer do treinamento (ROLLOUT_BUFFER do config.py)
+    buffer_class, buffer_kwargs = rollout_buffer_config()
+    model = PPO("CnnPolicy", vec_env, n_steps=n_steps, batch_size=batch_size, n_epochs=n_epochs, device="cpu",
+                rollout_buffer_class=buffer_class, rollout_buffer_kwargs=buffer_kwargs)
+    model.set_logger(configure(folder=None, format_strings=[]))
+
+    # Rollout sintético: o custo do update não depende do conteúdo das observações.
+    # O formato vem do modelo: o PPO envolve o VecEnv num VecTransposeImage e o
+    # rollout buffer guarda as observações com os canais primeiro.
+    rng = np.random.default_rng(0)
+    episode_starts = np.zeros(n_envs, dtype=np.float32)
+    for _ in range(n_steps):
+        obs = rng.integers(0, 256, size=(n_envs, *model.observation_space.shape), dtype=np.uint8)
+        actions = rng.uniform(-1, 1, size=(n_envs, 3)).astype(np.float32)
+        model.rollout_buffer.add(obs, actions, np.zeros(n_envs), episode_starts,
+                                 torch.zeros(n_envs), torch.zeros(n_envs))
+    model.rollout_buffer.compute_returns_and_advantage(last_values=torch.zeros(n_envs), dones=np.zeros(n_envs))
+
+    start = time.perf_counter()
+    model.train()
+    epoch_time = (time.perf_counter() - start) / n_epochs
+    vec_env.close()
+    return {"ppo_update_epoch": _metric(epoch_time, "s/epoch", False)}
+
+
+SUITE = {
+    "env": bench_env,
+    "frame_stack": bench_frame_stack,
+    "inference": bench_inference,
+    "ppo_update": bench_ppo_update,
+}
+
+
+def run_suite(stages=tuple(SUITE)):
+    import torch
+
+    results = {}
+    for stage in stages:
+        print(f"[bench] {stage}...", flush=True)
+        results.update(SUITE[stage]())
+    return {
+        "metadata": {
+            "python": sys.version.split()[0],
+            "torch": torch.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "torch_threads": torch.get_num_threads(),
+        },
+        "results": results,
+    }
+
+
+def compare(current, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Devolve a lista de métricas que pioraram mais que `tolerance` (fração)."""
+    regressions = []
+    for name, metric in current["results"].items():
+        if name not in baseline["results"]:
+            continue
+        old, new = baseline["results"][name]["value"], metric["value"]
+        if old == 0:
+            continue
+        change = (new - old) / old
+        worse = -change if metric["higher_is_better"] else change
+        status = "REGRESSÃO" if worse > tolerance else "ok"
+        print(f"{name:<28} {old:12.3f} -> {new:12.3f} {metric['unit']:<9} ({change:+.1%}) {status}")
+        if worse > tolerance:
+            regressions.append(name)
+    return regressions
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmarks (somente CPU) dos caminhos quentes do treinamento.")
+    parser.add_argument("--stages", nargs="+", default=list(SUITE), choices=list(SUITE))
+    parser.add_argument("--output", default=None, help="Salva os resultados neste JSON")
+    parser.add_argument("--save-baseline", action="store_true", help=f"Salva os resultados em {BASELINE_PATH}")
+    parser.add_argument("--compare", nargs="?", const=BASELINE_PATH, default=None, help="Compara com um baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    current = run_suite(args.stages)
+    for name, metric in current["results"].items():
+        print(f"{name:<28} {metric['value']:12.3f} {metric['unit']}")
+
+    for path in filter(None, (args.output, BASELINE_PATH if args.save_baseline else None)):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(current, f, indent=2)
+        print(f"Resultados salvos em {path}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\nComparação com {args.compare} (tolerância {args.tolerance:.0%}):")
+        regressions = compare(current, baseline, args.tolerance)
+        if regressions:
+            print(f"Regressões: {', '.join(regressions)}")
+            sys.exit(1)
+        print("Nenhuma regressão.")
@@ -0,0 +1,179 @@
+import time
+from functools import partial
+
+import gymnasium as gym
+from gymnasium import spaces
+from gymnasium.core import Wrapper
+import numpy as np
+from stable_baselines3.common.vec_env import VecMonitor
+
+from config import (ACTION_REPEAT, GRASS_DETECTION, N_ENVS, N_STACK, NATIVE_RENDER, PREPROCESSING,
+                    ROLLOUT_BUFFER, TRACK_CACHE, VEC_ENV_BACKEND)
+from grass_detection import (GRASS_PIXEL_THRESHOLD, OFF_TRACK_PENALTY, OFF_TRACK_WHEEL_THRESHOLD, VecGrassDetector,
+                             count_grass_pixels, count_off_track_wheels)
+from preprocessing import apply_preprocessing
+from shm_vec_env import make_backend_vec_env
+from track_cache import TrackCacheWrapper, ensure_track_pool
+from trajectory_recorder import TrajectoryRecorder
+
+# --- Ambiente do CarRacing usado no treinamento ---
+# Wrapper de recompensa/término na grama e fábricas dos ambientes, separados
+# do training.py para poderem ser importados sem iniciar um treino: o teste,
+# a avaliação, os benchmarks e os workers dos VecEnvs multiprocesso importam
+# daqui. A renderização nativa (pygame) e os rollout buffers (torch) só são
+# importados quando usados.
+
+
+def car_racing_action_space():
+    # Espaço de ações do CarRacing contínuo: volante em [-1, 1], acelerador e freio em [0, 1]
+    return spaces.Box(low=np.array([-1, 0, 0], dtype=np.float32), high=np.array([1, 1, 1], dtype=np.float32))
+
+
+class CustomCarRacingWrapper(Wrapper):
+    def __init__(self, env, off_track_detection="pixel", action_repeat=1, grass_threshold=GRASS_PIXEL_THRESHOLD,
+                 off_track_penalty=OFF_TRACK_PENALTY):
+        super().__init__(env)
+        self.env = env
+        self.last_reward_raw = 0
+        # "pixel": heurística de cor no frame; "contact": contato das rodas com
+        # os tiles da pista (estado do Box2D); None: a checagem fica a cargo do
+        # VecGrassDetector (em lote)
+        if off_track_detection not in ("pixel", "contact", None):
+            raise ValueError(f"Modo de detecção fora da pista desconhecido: {off_track_detection}")
+        if action_repeat < 1:
+            raise ValueError(f"action_repeat deve ser pelo menos 1: {action_repeat}")
+        self.off_track_detection = off_track_detection
+        # Cada ação do PPO é aplicada por action_repeat frames do simulador
+        self.action_repeat = action_repeat
+        self.grass_threshold = grass_threshold
+        self.off_track_penalty = off_track_penalty
+        self.grass_check_time = 0.0 # Tempo acumulado na checagem (lido pelo PhaseTimingCallback)
+
+    def _is_off_track(self, obs):
+        check_start = time.perf_counter()
+        if self.off_track_detection == "pixel":
+            # Heurística de cor para pixels de grama (a mesma do VecGrassDetector)
+            num_green_pixels = count_grass_pixels(obs)
+
+            # Se uma quantidade significativa de grama for detectada, termine o episódio
+            # O limiar e a penalidade padrão (GRASS_PIXEL_THRESHOLD, OFF_TRACK_PENALTY)
+            # ficam em grass_detection.py e podem ser ajustados lá ou por ambiente.
+            off_track = num_green_pixels > self.grass_threshold
+        elif self.off_track_detection == "contact":
+            # Exato e sem máscaras de cor: conta as rodas sem contato com tiles da pista
+            off_track = count_off_track_wheels(self.env) >= OFF_TRACK_WHEEL_THRESHOLD
+        else:
+            off_track = False
+        self.grass_check_time += time.perf_counter() - check_start
+        return off_track
+
+    def step(self, action):
+        total_reward = 0.0
+        for _ in range(self.action_repeat):
+            # Captura o resultado do step do ambiente base
+            step_result = self.env.step(action)
+
+            # Adapta-se à API do Gymnasium (4 ou 5 valores)
+            if len(step_result) == 5:
+                obs, reward, terminated, truncated, info = step_result
+            elif len(step_result) == 4:
+                obs, reward, terminated, info = step_result # 'terminated' aqui é o antigo 'done'
+                truncated = False # Assume truncated como False se a API for a antiga
+            else:
+                raise ValueError(f"O método step() do ambiente base retornou um número inesperado de valores: {len(step_result)}")
+
+            # --- Lógica de Término Imediato na Grama ---
+            # Checada a cada frame executado: o carro pode sair da pista no meio da repetição
+            if self._is_off_track(obs):
+                reward = self.off_track_penalty # Aplica uma penalidade alta
+                terminated = True         # Termina o episódio
+                # Opcional: Adicionar uma informação para depuração
+                info['off_track_by_grass'] = True
+
+            total_reward += reward
+            # Para a repetição no primeiro término: a penalidade entra uma única vez
+            # e nenhum frame é simulado depois do fim do episódio
+            if terminated or truncated:
+                break
+
+        self.last_reward_raw = total_reward # Para depuração
+
+        # O 'float(reward)' é importante para garantir o tipo correto,
+        # pois o Stable Baselines3 espera recompensas como float.
+        return obs, float(total_reward), terminated, truncated, info
+
+    def reset(self, **kwargs):
+        return self.env.reset(**kwargs)
+
+
+class SpacesOnlyEnv(gym.Env):
+    # Ambiente sem simulação: só leva os espaços do treinamento para construir
+    # o PPO (benchmarks do update, learner do modo distribuído)
+    def __init__(self, observation_space, action_space):
+        self.observation_space = observation_space
+        self.action_space = action_space
+
+    def reset(self, seed=None, options=None):
+        return self.observation_space.sample(), {}
+
+    def step(self, action):
+        return self.observation_space.sample(), 0.0, False, False, {}
+
+
+def make_env_with_wrappers(off_track_detection="pixel", track_cache=None, native_render=None, action_repeat=1,
+                           record_dir=None, grass_threshold=GRASS_PIXEL_THRESHOLD, off_track_penalty=OFF_TRACK_PENALTY):
+    env = gym.make("CarRacing-v3", continuous=True, render_mode="rgb_array")
+    if native_render is not None:
+        from native_render import LowResRenderWrapper
+
+        env = LowResRenderWrapper(env, **native_render)
+    if track_cache is not None:
+        env = TrackCacheWrapper(env, path=track_cache["path"], refresh_every=track_cache["refresh_every"],
+                                eviction=track_cache["eviction"])
+    env = CustomCarRacingWrapper(env, off_track_detection=off_track_detection, action_repeat=action_repeat,
+                                 grass_threshold=grass_threshold, off_track_penalty=off_track_penalty)
+    if record_dir is not None:
+        # Por fora do CustomCarRacingWrapper: grava a recompensa já com a penalidade da grama
+        env = TrajectoryRecorder(env, record_dir)
+    return env
+
+
+def make_training_vec_env(n_envs=N_ENVS, backend=VEC_ENV_BACKEND, grass_detection=GRASS_DETECTION, seed=0,
+                          preprocessing=PREPROCESSING, track_cache=TRACK_CACHE, native_render=NATIVE_RENDER,
+                          action_repeat=ACTION_REPEAT, record_dir=None,
+                          grass_threshold=GRASS_PIXEL_THRESHOLD, off_track_penalty=OFF_TRACK_PENALTY):
+    # Gravação só quando pedida: o train() passa o RECORD_TRAJECTORIES; avaliação,
+    # sweep, servidor e actors não misturam seus episódios ao dataset do treino
+    if native_render is not None and (grass_detection != "contact" or preprocessing is not None):
+        raise ValueError("A renderização nativa exige grass_detection='contact' e preprocessing=None")
+    if action_repeat > 1 and grass_detection == "vec":
+        raise ValueError("Com action_repeat > 1 use grass_detection='pixel' ou 'contact' (checagem a cada frame)")
+    if record_dir is not None and grass_detection == "vec":
+        # O VecGrassDetector fica acima do TrajectoryRecorder: a gravação sairia sem a penalidade e sem os términos
+        raise ValueError("Para gravar trajetórias use grass_detection='pixel' ou 'contact'")
+    if track_cache is not None:
+        ensure_track_pool(track_cache["path"], track_cache["pool_size"])
+    if grass_detection == "vec":
+        # A checagem em lote encerra episódios acima dos ambientes individuais,
+        # então o Monitor por ambiente dá lugar a um VecMonitor no topo.
+        env_fn = partial(make_env_with_wrappers, off_track_detection=None, track_cache=track_cache,
+                         native_render=native_render, action_repeat=action_repeat, record_dir=record_dir)
+        vec_env = make_backend_vec_env(env_fn, n_envs=n_envs, backend=backend, seed=seed, monitor=False)
+        vec_env = VecMonitor(VecGrassDetector(vec_env, threshold=grass_threshold, penalty=off_track_penalty))
+    elif grass_detection in ("pixel", "contact"):
+        env_fn = partial(make_env_with_wrappers, off_track_detection=grass_detection, track_cache=track_cache,
+                         native_render=native_render, action_repeat=action_repeat, record_dir=record_dir,
+                         grass_threshold=grass_threshold, off_track_penalty=off_track_penalty)
+        vec_env = make_backend_vec_env(env_fn, n_envs=n_envs, backend=backend, seed=seed)
+    else:
+        raise ValueError(f"Modo de detecção de grama desconhecido: {grass_detection}")
+    # O pré-processamento vem depois da detecção de grama, que precisa do frame RGB
+    return apply_preprocessing(vec_env, preprocessing)
+
+
+def rollout_buffer_config(rollout_buffer=ROLLOUT_BUFFER, n_stack=N_STACK):
+    from rollout_buffers import FrameDedupRolloutBuffer, Uint8RolloutBuffer
+
+    if rollout_buffer == "dedup":
+        return FrameDedupRolloutBuffer, {"n_stack": n_stack}
+    return Uint8RolloutBuffer, {}
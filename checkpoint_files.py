@@ -0,0 +1,40 @@
+import json
+import os
+import re
+
+# --- Nomes dos arquivos de checkpoint ---
+# `{prefixo}_{passos}_steps.zip`, o formato do CheckpointCallback do SB3 e do
+# AsyncCheckpointCallback. Só biblioteca padrão: o cli.py lista checkpoints
+# sem carregar torch, e os workers do sweep.py gravam seu estado sem
+# importar o SB3.
+CHECKPOINT_STEPS_PATTERN = re.compile(r"_(\d+)_steps\.zip$")
+
+
+def checkpoint_steps(path):
+    match = CHECKPOINT_STEPS_PATTERN.search(path)
+    return int(match.group(1)) if match else -1
+
+
+def list_checkpoints(save_path, name_prefix="rl_model"):
+    """Caminhos dos checkpoints de `name_prefix` em `save_path`, em ordem crescente de passos."""
+    if not os.path.isdir(save_path):
+        return []
+    paths = [os.path.join(save_path, filename) for filename in os.listdir(save_path)
+             if filename.startswith(f"{name_prefix}_") and CHECKPOINT_STEPS_PATTERN.search(filename)]
+    return sorted(paths, key=checkpoint_steps)
+
+
+def find_latest_checkpoint(save_path, name_prefix="rl_model"):
+    """Caminho e número de passos do checkpoint mais avançado em `save_path`, ou (None, 0)."""
+    checkpoints = list_checkpoints(save_path, name_prefix)
+    if not checkpoints:
+        return None, 0
+    return checkpoints[-1], checkpoint_steps(checkpoints[-1])
+
+
+def save_json_atomic(data, path):
+    # Escreve com outro nome e renomeia: quem lê nunca vê um JSON pela metade
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
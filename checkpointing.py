@@ -0,0 +1,134 @@
+import copy
+import os
+import signal
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+from stable_baselines3.common.callbacks import BaseCallback
+
+# --- Checkpoints assíncronos e retomada do treinamento ---
+# O CheckpointCallback do SB3 escreve o .zip dentro do model.learn, com a
+# coleta parada. Aqui o passo de treinamento só tira um snapshot em memória
+# (cópias dos pesos, do estado do otimizador e dos atributos do modelo) e um
+# thread em segundo plano serializa, monta e escreve o .zip. O arquivo é
+# escrito com outro nome, descarregado no disco (fsync) e renomeado no fim
+# (os.replace), então um checkpoint com o nome final está sempre completo,
+# mesmo depois de uma queda da máquina.
+# Os nomes seguem checkpoint_files.py, que também acha o checkpoint mais
+# avançado para retomar.
+
+
+def _snapshot(model):
+    # Mesmo conteúdo do BaseAlgorithm.save, mas com cópias dos tensores: o
+    # treino continua alterando os originais enquanto o arquivo é escrito.
+    # Os atributos também são copiados (ep_info_buffer, _last_obs...): o
+    # data_to_json, a parte cara, roda no thread de escrita.
+    from stable_baselines3.common.save_util import recursive_getattr
+
+    data = model.__dict__.copy()
+    exclude = set(model._excluded_save_params())
+    state_dicts_names, torch_variable_names = model._get_torch_save_params()
+    for name in state_dicts_names + torch_variable_names:
+        exclude.add(name.split(".")[0])
+    for name in exclude:
+        data.pop(name, None)
+
+    params = {name: copy.deepcopy(recursive_getattr(model, name).state_dict()) for name in state_dicts_names}
+    pytorch_variables = {name: copy.deepcopy(recursive_getattr(model, name)) for name in torch_variable_names}
+    return copy.deepcopy(data), params, pytorch_variables
+
+
+def _write_checkpoint(path, data, params, pytorch_variables):
+    # Layout do save_to_zip_file do SB3, para o PPO.load ler normalmente
+    import stable_baselines3
+    from stable_baselines3.common.save_util import data_to_json
+    from stable_baselines3.common.utils import get_system_info
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as file:
+        with zipfile.ZipFile(file, mode="w") as archive:
+            archive.writestr("data", data_to_json(data))
+            with archive.open("pytorch_variables.pth", mode="w", force_zip64=True) as f:
+                torch.save(pytorch_variables, f)
+            for name, state_dict in params.items():
+                with archive.open(f"{name}.pth", mode="w", force_zip64=True) as f:
+                    torch.save(state_dict, f)
+            archive.writestr("_stable_baselines3_version", stable_baselines3.__version__)
+            archive.writestr("system_info.txt", get_system_info(print_info=False)[1])
+        # Sem o fsync, uma queda logo após o os.replace pode deixar o nome final apontando para dados incompletos
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+
+class AsyncCheckpointCallback(BaseCallback):
+    """
+    Substituto do CheckpointCallback (mesmos nomes de arquivo,
+    `{name_prefix}_{num_timesteps}_steps.zip`) que escreve em segundo plano.
+
+    Com `handle_sigterm`, um SIGTERM (preempção) faz o treino parar no
+    próximo passo com um último checkpoint; `preempted` fica True para quem
+    chamou o model.learn saber que o treino não terminou.
+    """
+
+    def __init__(self, save_freq, save_path, name_prefix="rl_model", handle_sigterm=True, verbose=0):
+        super().__init__(verbose)
+        self.save_freq = save_freq
+        self.save_path = save_path
+        self.name_prefix = name_prefix
+        self.handle_sigterm = handle_sigterm
+        self.preempted = False
+        self._stop_requested = False
+        self._previous_handler = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="checkpoint")
+        self._pending = []
+
+    def _init_callback(self):
+        os.makedirs(self.save_path, exist_ok=True)
+        if self.handle_sigterm:
+            self._previous_handler = signal.signal(signal.SIGTERM, self._on_sigterm)
+
+    def _on_sigterm(self, signum, frame):
+        self._stop_requested = True
+
+    @property
+    def stop_requested(self):
+        # Para loops de treino próprios (learner distribuído), que não chamam o on_step
+        return self._stop_requested
+
+    def checkpoint_path(self, num_timesteps):
+        return os.path.join(self.save_path, f"{self.name_prefix}_{num_timesteps}_steps.zip")
+
+    def save_async(self):
+        # Do modelo, não do callback: quem chama fora do model.learn não atualiza o self.num_timesteps
+        path = self.checkpoint_path(self.model.num_timesteps)
+        self._pending = [future for future in self._pending if not future.done()]
+        self._pending.append(self._executor.submit(_write_checkpoint, path, *_snapshot(self.model)))
+        if self.verbose >= 2:
+            print(f"Salvando checkpoint em {path} (em segundo plano)")
+        return path
+
+    def wait(self):
+        # Propaga erros de escrita (disco cheio etc.) em vez de perdê-los no thread
+        for future in self._pending:
+            future.result()
+        self._pending = []
+
+    def _on_step(self):
+        if self._stop_requested:
+            self.preempted = True
+            self.save_async()
+            self.wait()
+            print(f"SIGTERM recebido: checkpoint salvo em {self.checkpoint_path(self.model.num_timesteps)}")
+            return False
+        if self.n_calls % self.save_freq == 0:
+            self.save_async()
+        return True
+
+    def _on_training_end(self):
+        self.wait()
+        if self._previous_handler is not None:
+            signal.signal(signal.SIGTERM, self._previous_handler)
+            self._previous_handler = None
+
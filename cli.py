@@ -0,0 +1,109 @@
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# --- Ponto de entrada único com imports sob demanda ---
+# Este módulo só importa a biblioteca padrão. Cada subcomando roda o bloco
+# `__main__` do módulo correspondente (via runpy), então torch, SB3 e pygame
+# só são carregados pelos subcomandos que precisam deles; list-checkpoints
+# lê só o config.py e o checkpoint_files.py. `startup` mede a partida a frio
+# de cada subcomando num interpretador novo.
+#
+#   python cli.py train --total-timesteps 500000
+#   python cli.py eval car_racing_ppo_models/car_racing_model_400000_steps.zip
+#   python cli.py startup --repeat 5
+
+# subcomando -> (módulo, descrição); os argumentos seguintes vão para o módulo
+MODULE_COMMANDS = {
+    "train": ("training", "Treina o PPO com as configurações do config.py"),
+    "eval": ("evaluate", "Avaliação headless e paralela de um modelo"),
+    "bench": ("benchmarks", "Benchmarks dos caminhos quentes do treinamento"),
+    "tournament": ("tournament", "Avalia e ranqueia os checkpoints salvos"),
+    "sweep": ("sweep", "Busca de hiperparâmetros com ASHA"),
+    "export": ("inference", "Exporta a política para TorchScript"),
+    "policy-server": ("policy_server", "Servidor de inferência com micro-batching"),
+    "distributed": ("distributed", "Treinamento com actors e learner separados"),
+    "tracks": ("track_cache", "Gera o pool de pistas pré-geradas"),
+    "trajectories": ("trajectory_recorder", "Resumo de um diretório de trajetórias gravadas"),
+}
+
+
+def run_module_command(command, argv):
+    import runpy
+
+    module, _ = MODULE_COMMANDS[command]
+    # alter_sys: o módulo vira o __main__ de verdade, então os workers "spawn"
+    # (sweep, tournament, distributed) reimportam o módulo certo
+    sys.argv = [module, *argv]
+    runpy.run_module(module, run_name="__main__", alter_sys=True)
+
+
+def measure_startup(command, repeat=3):
+    """
+    Tempos (s) de `python cli.py <command> --help` em interpretadores novos:
+    importação dos módulos do subcomando mais o parse dos argumentos.
+    """
+    if command == "python":
+        args = [sys.executable, "-c", "pass"] # Custo do próprio interpretador, como referência
+    else:
+        args = [sys.executable, os.path.abspath(__file__), command, "--help"]
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def build_parser():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Treinamento, avaliação e ferramentas do CarRacing com PPO.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for command, (module, description) in MODULE_COMMANDS.items():
+        subparsers.add_parser(command, help=f"{description} ({module}.py)", add_help=False)
+
+    checkpoints_parser = subparsers.add_parser("list-checkpoints", help="Lista os checkpoints salvos")
+    checkpoints_parser.add_argument("--dir", default=None, help="Padrão: CHECKPOINT_DIR do config.py")
+    checkpoints_parser.add_argument("--prefix", default=None, help="Padrão: CHECKPOINT_PREFIX do config.py")
+
+    startup_parser = subparsers.add_parser("startup", help="Mede a partida a frio de cada subcomando")
+    startup_parser.add_argument("commands", nargs="*", default=["python", "list-checkpoints", *MODULE_COMMANDS],
+                                help="Subcomandos medidos (\"python\" = interpretador vazio)")
+    startup_parser.add_argument("--repeat", type=int, default=3)
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    # Subcomandos de módulo: o resto da linha vai inteiro para o parser do módulo
+    if argv and argv[0] in MODULE_COMMANDS:
+        return run_module_command(argv[0], argv[1:])
+
+    args = build_parser().parse_args(argv)
+    if args.command == "list-checkpoints":
+        from checkpoint_files import checkpoint_steps, list_checkpoints
+        from config import CHECKPOINT_DIR, CHECKPOINT_PREFIX
+
+        save_path = args.dir or CHECKPOINT_DIR
+        checkpoints = list_checkpoints(save_path, args.prefix or CHECKPOINT_PREFIX)
+        for path in checkpoints:
+            print(f"{checkpoint_steps(path):>12,} passos  {os.path.getsize(path) / 2**20:7.1f} MiB  "
+                  f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(os.path.getmtime(path)))}  {path}")
+        print(f"{len(checkpoints)} checkpoints em {save_path}")
+    elif args.command == "startup":
+        print(f"Partida a frio (mediana de {args.repeat} execuções de `<subcomando> --help`):")
+        for command in args.commands:
+            try:
+                timings = measure_startup(command, args.repeat)
+            except subprocess.CalledProcessError:
+                # Dependência faltando, por exemplo: os outros subcomandos continuam medidos
+                print(f"{command:<18} falhou")
+                continue
+            print(f"{command:<18} {statistics.median(timings) * 1e3:8.0f} ms  (mín. {min(timings) * 1e3:.0f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import os
+
+# --- Configurações de Treinamento ---
+# Só constantes: importar este módulo não carrega torch, SB3 nem pygame, então
+# ferramentas leves (cli.py list-checkpoints, por exemplo) podem lê-las.
+
+# Configuração padrão do pré-processamento (preprocessing.py):
+# crop_hud: remove a barra do HUD (últimas HUD_ROWS linhas)
+# grayscale: converte RGB para um canal de luminância
+# size: lado (altura e largura) da observação final
+DEFAULT_PREPROCESSING = {"crop_hud": True, "grayscale": True, "size": 64}
+
+# Um ambiente por núcleo. O lote de cada rollout do PPO é n_steps * N_ENVS,
+# então ele muda de máquina para máquina: para comparar treinos entre máquinas
+# (ou retomar um treino em outra), fixe N_ENVS ou ajuste o n_steps do PPO_HYPERPARAMS.
+N_ENVS = os.cpu_count() or 4
+VEC_ENV_BACKEND = "shm" # "dummy" (serial), "subproc" ou "shm" (memória compartilhada)
+# Renderização nativa da observação em baixa resolução, sem HUD e com paleta
+# simplificada (native_render.py), ex.: {"size": 64, "grayscale": True, "skip_render": True}.
+# None = render padrão do CarRacing (96x96 RGB) seguido do PREPROCESSING.
+NATIVE_RENDER = None
+# Frames do simulador por ação do PPO (frame skip); a recompensa é somada
+# nos frames e a checagem de grama roda em cada um deles. Ex.: 4
+ACTION_REPEAT = 1
+# Diretório onde cada ambiente do treinamento (training.py) grava suas trajetórias
+# (trajectory_recorder.py); avaliação, sweep e demais ferramentas não gravam. None = não grava
+RECORD_TRAJECTORIES = None
+# "pixel" (por ambiente), "vec" (em lote, VecGrassDetector) ou "contact" (Box2D).
+# Sem HUD e sem RGB só o "contact" funciona com a renderização nativa; o "vec"
+# só vê o último frame de cada repetição, então com ACTION_REPEAT > 1 a
+# checagem volta para o wrapper de cada ambiente. O mesmo vale ao gravar
+# trajetórias: o gravador de cada ambiente não enxerga as saídas de pista do "vec".
+if NATIVE_RENDER is not None:
+    GRASS_DETECTION = "contact"
+elif ACTION_REPEAT > 1 or RECORD_TRAJECTORIES is not None:
+    GRASS_DETECTION = "pixel"
+else:
+    GRASS_DETECTION = "vec"
+# Recorte/cinza/64x64 antes do VecFrameStack (ex.: DEFAULT_PREPROCESSING); None =
+# observação sem pré-processamento (96x96 RGB). Muda o formato da observação:
+# modelos e checkpoints treinados sem ele (como os do test.py) não rodam com ele,
+# nem ao retomar o treino. Ative só para treinos novos e mantenha para avaliá-los.
+PREPROCESSING = None
+N_STACK = 4 # Frames empilhados por observação
+# "uint8": uma observação empilhada por passo; "dedup": cada frame guardado uma
+# única vez, pilhas montadas só ao amostrar minibatches (~N_STACK vezes menos memória)
+ROLLOUT_BUFFER = "dedup"
+# "pipelined": envs divididos em N_ENV_GROUPS grupos, inferência de um grupo
+# sobreposta à simulação dos outros; "lockstep": coleta padrão do SB3
+ROLLOUT_MODE = "pipelined"
+N_ENV_GROUPS = 2 # Limitado a N_ENVS: com um único ambiente a coleta fica sequencial
+# Pool de pistas pré-geradas usado nos resets (track_cache.py), ex.:
+# {"path": "./track_cache.npz", "pool_size": 512, "refresh_every": 50, "eviction": "fifo"}.
+# Desligado por padrão: com ele o treino sorteia pistas de um pool finito em vez
+# de pistas procedurais novas, o que muda a distribuição de treinamento.
+# None = gerar uma pista nova a cada reset
+TRACK_CACHE = None
+# Hiperparâmetros do PPO (também usados pelo learner do modo distribuído)
+PPO_HYPERPARAMS = {
+    "learning_rate": 0.0003,
+    "n_steps": 2048,
+    "batch_size": 64,
+    "n_epochs": 10,
+    "gamma": 0.99,
+    "gae_lambda": 0.95,
+    "clip_range": 0.2,
+    "ent_coef": 0.01,
+    "max_grad_norm": 0.5,
+}
+# Divisão dos núcleos entre learner e workers dos ambientes (resource_scheduler.py):
+# "calibrate" mede algumas divisões antes do model.learn e fica com a mais rápida;
+# "static" usa LEARNER_CORES (None = um quarto dos núcleos); None não prende nada.
+# Só no Linux (afinidade de CPU): nos outros sistemas o treino avisa e segue sem.
+CORE_SCHEDULING = None
+LEARNER_CORES = None
+TOTAL_TIMESTEPS = 2_400_000 # Lembre-se de aumentar isso para milhões para treinamento real
+SAVE_FREQ = 100000
+CHECKPOINT_DIR = "./car_racing_ppo_models/"
+CHECKPOINT_PREFIX = "car_racing_model"
+# True = continua do checkpoint mais avançado em CHECKPOINT_DIR (pesos, otimizador
+# e num_timesteps) em vez de começar do zero. Desligado por padrão: um checkpoint
+# velho de outra configuração seria retomado sem aviso. Também: training.py --resume
+RESUME = False
@@ -0,0 +1,490 @@
+import os
+import queue
+import socket
+import threading
+import time
+from collections import deque
+from multiprocessing import AuthenticationError, current_process
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+import torch as th
+from stable_baselines3.common.utils import obs_as_tensor, safe_mean
+
+from pipelined_rollout import bootstrap_truncated
+from policy_server import parse_address
+
+# --- Modo distribuído: actors coletam, um learner treina ---
+# Cada actor é um processo (nesta máquina ou em outra) com seus próprios
+# ambientes (make_training_vec_env -> make_env_with_wrappers) e uma cópia da
+# política. Ele coleta segmentos de SEGMENT_STEPS passos e os envia por TCP
+# ao learner, que junta segmentos de vários actors num rollout buffer, roda
+# o model.train() do PPO e publica os pesos novos na resposta seguinte a
+# cada actor. Actors podem entrar e sair a qualquer momento: o learner só
+# espera ter colunas (ambientes) suficientes para a próxima atualização.
+# Cada segmento leva só o frame novo de cada passo (mais a pilha inicial): o
+# learner remonta as pilhas do VecFrameStack, com ~N_STACK vezes menos rede.
+#
+# As conexões são as do multiprocessing.connection: cada ponta prova que
+# conhece a chave (HMAC) antes de qualquer mensagem ser lida, então o pickle
+# das mensagens só chega de quem tem a chave. Com learner e actors em
+# máquinas diferentes, defina a mesma chave em AUTHKEY_ENV nas duas pontas;
+# sem ela vale a chave do processo, que só os actors do modo "local" herdam.
+DEFAULT_LEARNER_ADDRESS = "127.0.0.1:5555"
+AUTHKEY_ENV = "CAR_RACING_AUTHKEY"
+SEGMENT_STEPS = 256 # Passos por ambiente em cada segmento enviado
+MIN_ENVS_PER_UPDATE = 16 # Colunas (ambientes) mínimas por atualização do PPO
+MAX_POLICY_LAG = 2 # Segmentos coletados com pesos mais antigos que isso são descartados
+STOP_TIMEOUT = 120.0 # Segundos que o learner espera cada actor mandar o próximo segmento e receber o "stop"
+
+
+def authkey_from_env():
+    authkey = os.environ.get(AUTHKEY_ENV)
+    return authkey.encode() if authkey else None
+
+
+def _resolve_authkey(authkey):
+    # None no multiprocessing.connection desligaria a autenticação: aqui vira a chave do processo
+    return authkey if authkey is not None else current_process().authkey
+
+
+def _set_nodelay(connection):
+    # Respostas curtas ("ack") não ficam esperando o algoritmo de Nagle
+    with socket.socket(fileno=os.dup(connection.fileno())) as sock:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+def restack_observations(initial_obs, frames, episode_starts):
+    """
+    Pilhas (canais primeiro) de cada passo a partir da pilha do primeiro passo
+    e dos frames novos, com a regra do VecFrameStack: depois de um reset a
+    pilha recomeça zerada, só com o frame novo nos últimos canais.
+    """
+    channels = frames.shape[2]
+    stack = initial_obs.copy()
+    for t in range(len(frames)):
+        if t > 0:
+            stack[:, :-channels] = stack[:, channels:]
+            stack[:, -channels:] = frames[t]
+            stack[episode_starts[t].astype(bool), :-channels] = 0
+        yield stack
+
+
+def _cpu_state_dict(policy):
+    return {name: tensor.detach().cpu().clone() for name, tensor in policy.state_dict().items()}
+
+
+def make_actor_vec_env(n_envs, seed=0, **kwargs):
+    # Mesma pilha de um grupo do treinamento em pipeline: o learner recebe
+    # observações já empilhadas e com canais primeiro, como a CnnPolicy espera
+    from stable_baselines3.common.vec_env import VecFrameStack, VecTransposeImage
+
+    from car_racing_env import make_training_vec_env
+    from config import N_STACK
+
+    # Sem pool de pistas por padrão: os actors geram pistas novas, como a avaliação
+    kwargs.setdefault("track_cache", None)
+    vec_env = make_training_vec_env(n_envs=n_envs, seed=seed, **kwargs)
+    return VecTransposeImage(VecFrameStack(vec_env, n_stack=N_STACK))
+
+
+# --- Actor ---
+class RolloutActor:
+    """Coleta segmentos com a cópia local da política; os pesos vêm do learner."""
+
+    def __init__(self, n_envs, seed=0):
+        self.vec_env = make_actor_vec_env(n_envs, seed=seed)
+        self.policy = None
+        self.version = -1
+        self._last_obs = None
+        self._last_episode_starts = None
+
+    def configure(self, config):
+        if self.vec_env.observation_space != config["observation_space"]:
+            raise ValueError(f"Observações do actor {self.vec_env.observation_space} diferentes das do learner "
+                             f"{config['observation_space']}: confira a configuração do config.py nas duas pontas")
+        self.gamma = config["gamma"]
+        self.segment_steps = config["segment_steps"]
+        self.n_stack = config["n_stack"]
+        if self.policy is None:
+            self.policy = config["policy_class"](config["observation_space"], config["action_space"],
+                                                 lr_schedule=lambda _: 0.0, **config["policy_kwargs"])
+            self.policy.set_training_mode(False)
+        self.load_weights(config["version"], config["state_dict"])
+
+    def load_weights(self, version, state_dict):
+        self.policy.load_state_dict(state_dict)
+        self.version = version
+
+    def collect_segment(self):
+        if self._last_obs is None:
+            self._last_obs = self.vec_env.reset()
+            self._last_episode_starts = np.ones(self.vec_env.num_envs, dtype=bool)
+        action_space = self.vec_env.action_space
+        initial_obs = self._last_obs.copy()
+        channels = initial_obs.shape[1] // self.n_stack
+        fields = {name: [] for name in ("frames", "actions", "rewards", "episode_starts", "values", "log_probs")}
+        ep_infos = []
+        for _ in range(self.segment_steps):
+            with th.no_grad():
+                actions, values, log_probs = self.policy(obs_as_tensor(self._last_obs, "cpu"))
+            actions = actions.numpy()
+            clipped_actions = np.clip(actions, action_space.low, action_space.high)
+            new_obs, rewards, dones, infos = self.vec_env.step(clipped_actions)
+
+            bootstrap_truncated(self.policy, self.gamma, rewards, dones, infos)
+            ep_infos.extend(info["episode"] for info in infos if "episode" in info)
+
+            fields["frames"].append(self._last_obs[:, -channels:])
+            fields["actions"].append(actions)
+            fields["rewards"].append(rewards.astype(np.float32))
+            fields["episode_starts"].append(self._last_episode_starts.astype(np.float32))
+            fields["values"].append(values.flatten().numpy())
+            fields["log_probs"].append(log_probs.numpy())
+            self._last_obs, self._last_episode_starts = new_obs, dones
+
+        with th.no_grad():
+            last_values = self.policy.predict_values(obs_as_tensor(self._last_obs, "cpu")).flatten().numpy()
+        segment = {name: np.stack(values) for name, values in fields.items()}
+        segment.update(type="segment", version=self.version, initial_obs=initial_obs, last_values=last_values,
+                       last_dones=self._last_episode_starts.astype(np.float32), ep_infos=ep_infos)
+        return segment
+
+    def run(self, address, authkey=None, retry_interval=2.0):
+        """Conecta (e reconecta) ao learner até ele mandar parar."""
+        address = parse_address(address)
+        while True:
+            try:
+                with Client(address, family="AF_INET", authkey=_resolve_authkey(authkey)) as connection:
+                    _set_nodelay(connection)
+                    connection.send({"type": "hello", "n_envs": self.vec_env.num_envs, "host": socket.gethostname()})
+                    self.configure(connection.recv())
+                    while True:
+                        connection.send(self.collect_segment())
+                        reply = connection.recv()
+                        if reply["type"] == "stop":
+                            return
+                        if reply["type"] == "weights":
+                            self.load_weights(reply["version"], reply["state_dict"])
+            except AuthenticationError:
+                raise RuntimeError(f"Chave recusada pelo learner: confira {AUTHKEY_ENV} nas duas pontas") from None
+            except (ConnectionError, OSError, EOFError) as e:
+                print(f"[actor] sem conexão com o learner ({e}); nova tentativa em {retry_interval:.0f} s", flush=True)
+                time.sleep(retry_interval)
+
+    def close(self):
+        self.vec_env.close()
+
+
+def run_actor(address=DEFAULT_LEARNER_ADDRESS, n_envs=4, seed=0, torch_threads=1, authkey=None):
+    th.set_num_threads(torch_threads)
+    actor = RolloutActor(n_envs, seed=seed)
+    try:
+        actor.run(address, authkey=authkey)
+    finally:
+        actor.close()
+
+
+# --- Learner ---
+class _ActorServer:
+    """
+    Aceita actors e troca mensagens com cada um num thread próprio.
+
+    Os threads dos actors não são daemon: no close() o learner espera cada
+    um mandar "stop" em resposta ao próximo segmento, senão os actors
+    remotos ficariam tentando reconectar para sempre.
+    """
+
+    def __init__(self, address, authkey, actor_config, weights, queue_size):
+        self.listener = Listener(address, family="AF_INET", backlog=16, authkey=_resolve_authkey(authkey))
+        self.actor_config = actor_config
+        self.weights = weights
+        self.segments = queue.Queue(maxsize=queue_size)
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()
+        self.n_actors = 0
+        self._threads = []
+
+    @property
+    def address(self):
+        return self.listener.address
+
+    def start(self):
+        # O thread que aceita conexões pode ser daemon: ele não conversa com nenhum actor
+        threading.Thread(target=self._accept_loop, daemon=True, name="learner-accept").start()
+
+    def _accept_loop(self):
+        while not self.stopping.is_set():
+            try:
+                connection = self.listener.accept()
+            except AuthenticationError:
+                print("[learner] conexão recusada: chave errada", flush=True)
+                continue
+            except OSError:
+                return # Listener fechado
+            thread = threading.Thread(target=self._handle, args=(connection,), name="learner-actor")
+            with self.lock:
+                self._threads = [t for t in self._threads if t.is_alive()]
+                self._threads.append(thread)
+            thread.start()
+
+    def _handle(self, connection):
+        with connection:
+            _set_nodelay(connection)
+            try:
+                hello = connection.recv()
+                with self.lock:
+                    self.n_actors += 1
+                try:
+                    print(f"[learner] actor conectado: {hello['host']} ({hello['n_envs']} ambientes)", flush=True)
+                    self._serve(connection)
+                finally:
+                    with self.lock:
+                        self.n_actors -= 1
+                    print("[learner] actor desconectado", flush=True)
+            except (ConnectionError, OSError, EOFError):
+                pass
+
+    def _serve(self, connection):
+        version, state_dict = self.weights
+        connection.send({**self.actor_config, "version": version, "state_dict": state_dict})
+        while True:
+            segment = connection.recv()
+            # Bloqueia quando o learner está atrasado, sem perder o aviso de parada
+            while not self.stopping.is_set():
+                try:
+                    self.segments.put(segment, timeout=1.0)
+                    break
+                except queue.Full:
+                    continue
+            if self.stopping.is_set():
+                connection.send({"type": "stop"})
+                return
+            version, state_dict = self.weights
+            if version > segment["version"]:
+                connection.send({"type": "weights", "version": version, "state_dict": state_dict})
+            else:
+                connection.send({"type": "ack"})
+
+    def get_segment(self, timeout):
+        return self.segments.get(timeout=timeout)
+
+    def close(self, timeout=STOP_TIMEOUT):
+        # Os actors recebem "stop" em resposta ao próximo segmento que enviarem
+        self.stopping.set()
+        self.listener.close()
+        with self.lock:
+            threads = list(self._threads)
+        deadline = time.monotonic() + timeout
+        for thread in threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        if any(thread.is_alive() for thread in threads):
+            print("[learner] actors sem resposta ao 'stop'; saindo mesmo assim", flush=True)
+
+
+class Learner:
+    """
+    Recebe segmentos dos actors e roda as atualizações do PPO.
+
+    Cada atualização junta segmentos até ter pelo menos `min_envs` colunas
+    (ambientes); o rollout buffer é realocado quando esse número muda, já
+    que os actors podem ter tamanhos diferentes e entrar ou sair.
+    """
+
+    def __init__(self, address=DEFAULT_LEARNER_ADDRESS, segment_steps=SEGMENT_STEPS, min_envs=MIN_ENVS_PER_UPDATE,
+                 max_policy_lag=MAX_POLICY_LAG, resume=False, authkey=None):
+        from stable_baselines3 import PPO
+        from stable_baselines3.common.vec_env import DummyVecEnv
+
+        from car_racing_env import SpacesOnlyEnv
+        from checkpoint_files import find_latest_checkpoint
+        from checkpointing import AsyncCheckpointCallback
+        from config import CHECKPOINT_DIR, CHECKPOINT_PREFIX, N_STACK, PPO_HYPERPARAMS
+
+        probe = make_actor_vec_env(1, backend="dummy", track_cache=None)
+        observation_space, action_space = probe.observation_space, probe.action_space
+        probe.close()
+
+        self.segment_steps = segment_steps
+        self.min_envs = min_envs
+        self.max_policy_lag = max_policy_lag
+        spaces_env = DummyVecEnv([lambda: SpacesOnlyEnv(observation_space, action_space)])
+        resume_path, _ = find_latest_checkpoint(CHECKPOINT_DIR, CHECKPOINT_PREFIX) if resume else (None, 0)
+        if resume_path is not None:
+            self.model = PPO.load(resume_path, env=spaces_env, tensorboard_log="./car_racing_ppo_tensorboard/")
+            print(f"[learner] retomando de {resume_path} ({self.model.num_timesteps} passos)")
+        else:
+            hyperparams = {**PPO_HYPERPARAMS, "n_steps": segment_steps}
+            self.model = PPO("CnnPolicy", spaces_env, tensorboard_log="./car_racing_ppo_tensorboard/", **hyperparams)
+        self.checkpoint = AsyncCheckpointCallback(save_freq=1, save_path=CHECKPOINT_DIR, name_prefix=CHECKPOINT_PREFIX)
+
+        self.version = 0
+        actor_config = {
+            "type": "config",
+            "observation_space": observation_space,
+            "action_space": action_space,
+            "policy_class": self.model.policy_class,
+            "policy_kwargs": self.model.policy_kwargs,
+            "gamma": self.model.gamma,
+            "segment_steps": segment_steps,
+            "n_stack": N_STACK,
+        }
+        self.server = _ActorServer(parse_address(address), authkey, actor_config,
+                                   weights=(self.version, _cpu_state_dict(self.model.policy)),
+                                   queue_size=4 * max(1, min_envs))
+
+    def _gather_segments(self):
+        # None quando chega um SIGTERM: a espera por segmentos não pode prender o learner
+        segments, n_columns, stale = [], 0, 0
+        while n_columns < self.min_envs:
+            if self.checkpoint.stop_requested:
+                return None
+            try:
+                segment = self.server.get_segment(timeout=1.0)
+            except queue.Empty:
+                continue
+            if self.version - segment["version"] > self.max_policy_lag:
+                stale += 1
+                continue
+            segments.append(segment)
+            n_columns += segment["rewards"].shape[1]
+        return segments, n_columns, stale
+
+    def _fill_buffer(self, segments, n_columns):
+        from car_racing_env import rollout_buffer_config
+
+        model = self.model
+        buffer = model.rollout_buffer
+        # O mesmo rollout buffer do treinamento (ROLLOUT_BUFFER do config.py)
+        buffer_class, buffer_kwargs = rollout_buffer_config()
+        if type(buffer) is not buffer_class or buffer.n_envs != n_columns:
+            buffer = model.rollout_buffer = buffer_class(
+                self.segment_steps, model.observation_space, model.action_space, device=model.device,
+                gamma=model.gamma, gae_lambda=model.gae_lambda, n_envs=n_columns, **buffer_kwargs,
+            )
+        buffer.reset()
+        concat = {name: np.concatenate([segment[name] for segment in segments], axis=1)
+                  for name in ("frames", "actions", "rewards", "episode_starts", "values", "log_probs")}
+        initial_obs = np.concatenate([segment["initial_obs"] for segment in segments])
+        stacks = restack_observations(initial_obs, concat["frames"], concat["episode_starts"])
+        for t, obs in enumerate(stacks):
+            buffer.add(obs, concat["actions"][t], concat["rewards"][t], concat["episode_starts"][t],
+                       th.as_tensor(concat["values"][t]), th.as_tensor(concat["log_probs"][t]))
+        last_values = th.as_tensor(np.concatenate([segment["last_values"] for segment in segments]))
+        last_dones = np.concatenate([segment["last_dones"] for segment in segments])
+        buffer.compute_returns_and_advantage(last_values=last_values, dones=last_dones)
+
+    def learn(self, total_timesteps, save_freq):
+        """
+        `save_freq` em passos por ambiente, como no CheckpointCallback do
+        training.py: um checkpoint a cada save_freq * (colunas por atualização)
+        passos, então o mesmo SAVE_FREQ dá o mesmo intervalo nos dois modos.
+        """
+        from stable_baselines3.common.utils import configure_logger
+
+        model = self.model
+        reset = model.num_timesteps == 0
+        model.set_logger(configure_logger(1, model.tensorboard_log, "PPO_distributed", reset))
+        if model.ep_info_buffer is None:
+            # Normalmente criados pelo _setup_learn do model.learn, que o learner não chama
+            model.ep_info_buffer = deque(maxlen=model._stats_window_size)
+            model.ep_success_buffer = deque(maxlen=model._stats_window_size)
+        self.checkpoint.init_callback(model)
+        self.server.start()
+        print(f"[learner] aguardando actors em {self.server.address}", flush=True)
+
+        last_save, start = model.num_timesteps, time.perf_counter()
+        try:
+            while model.num_timesteps < total_timesteps:
+                gathered = self._gather_segments()
+                if gathered is None:
+                    break
+                segments, n_columns, stale = gathered
+                self._fill_buffer(segments, n_columns)
+                model.num_timesteps += self.segment_steps * n_columns
+                model.ep_info_buffer.extend(info for segment in segments for info in segment["ep_infos"])
+                model._update_current_progress_remaining(model.num_timesteps, total_timesteps)
+                model.train()
+
+                policy_lag = np.mean([self.version - segment["version"] for segment in segments])
+                self.version += 1
+                self.server.weights = (self.version, _cpu_state_dict(model.policy))
+                if model.ep_info_buffer:
+                    model.logger.record("rollout/ep_rew_mean", safe_mean([info["r"] for info in model.ep_info_buffer]))
+                    model.logger.record("rollout/ep_len_mean", safe_mean([info["l"] for info in model.ep_info_buffer]))
+                model.logger.record("distributed/actors", self.server.n_actors)
+                model.logger.record("distributed/envs_per_update", n_columns)
+                model.logger.record("distributed/stale_segments", stale)
+                model.logger.record("distributed/policy_lag", policy_lag)
+                model.logger.record("time/fps", int(model.num_timesteps / (time.perf_counter() - start)))
+                model.logger.dump(step=model.num_timesteps)
+
+                if model.num_timesteps - last_save >= save_freq * n_columns:
+                    self.checkpoint.save_async()
+                    last_save = model.num_timesteps
+            if self.checkpoint.stop_requested:
+                # Preempção: último checkpoint e saída sem o modelo final, como no training.py
+                self.checkpoint.preempted = True
+                path = self.checkpoint.save_async()
+                print(f"[learner] SIGTERM recebido: checkpoint salvo em {path}", flush=True)
+        finally:
+            self.server.close()
+            # Espera as escritas pendentes e devolve o tratador de SIGTERM anterior
+            self.checkpoint.on_training_end()
+        if not self.checkpoint.preempted:
+            model.save("car_racing_ppo_final_model")
+        return model
+
+
+if __name__ == "__main__":
+    import argparse
+    import multiprocessing as mp
+
+    from config import SAVE_FREQ, TOTAL_TIMESTEPS
+
+    parser = argparse.ArgumentParser(description="Treinamento distribuído: actors coletam, o learner treina.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    learner_parser = subparsers.add_parser("learner", help="Roda o learner (PPO) e espera actors")
+    learner_parser.add_argument("--address", default=DEFAULT_LEARNER_ADDRESS,
+                                help=f"host:porta para escutar (0.0.0.0 aceita actors de outras máquinas; "
+                                     f"defina {AUTHKEY_ENV} nas duas pontas)")
+    learner_parser.add_argument("--min-envs", type=int, default=MIN_ENVS_PER_UPDATE)
+    learner_parser.add_argument("--resume", action="store_true", help="Continua do checkpoint mais avançado")
+    actor_parser = subparsers.add_parser("actor", help="Roda um actor conectado ao learner")
+    actor_parser.add_argument("--address", default=DEFAULT_LEARNER_ADDRESS)
+    actor_parser.add_argument("--n-envs", type=int, default=4)
+    actor_parser.add_argument("--seed", type=int, default=0)
+    local_parser = subparsers.add_parser("local", help="Learner e actors nesta máquina (para testes)")
+    local_parser.add_argument("--address", default=DEFAULT_LEARNER_ADDRESS)
+    local_parser.add_argument("--actors", type=int, default=2)
+    local_parser.add_argument("--envs-per-actor", type=int, default=4)
+    local_parser.add_argument("--total-timesteps", type=int, default=TOTAL_TIMESTEPS)
+    args = parser.parse_args()
+
+    if args.command in ("actor", "learner") and authkey_from_env() is None:
+        parser.error(f"defina a mesma chave na variável de ambiente {AUTHKEY_ENV} do learner e dos actors")
+    if args.command == "actor":
+        run_actor(args.address, n_envs=args.n_envs, seed=args.seed, authkey=authkey_from_env())
+    elif args.command == "learner":
+        learner = Learner(args.address, min_envs=args.min_envs, resume=args.resume, authkey=authkey_from_env())
+        learner.learn(TOTAL_TIMESTEPS, SAVE_FREQ)
+    else:
+        # Os actors sobem em processos novos ("spawn"): este processo já importou o torch.
+        # Não podem ser daemon, porque criam os workers dos próprios ambientes. Sem
+        # AUTHKEY_ENV, learner e actors usam a chave deste processo, herdada no spawn.
+        ctx = mp.get_context("spawn")
+        actors = [
+            ctx.Process(target=run_actor, args=(args.address, args.envs_per_actor, 1000 * i),
+                        kwargs={"authkey": authkey_from_env()})
+            for i in range(args.actors)
+        ]
+        learner = Learner(args.address, min_envs=args.actors * args.envs_per_actor, authkey=authkey_from_env())
+        for process in actors:
+            process.start()
+        try:
+            learner.learn(args.total_timesteps, SAVE_FREQ)
+        finally:
+            for process in actors:
+                process.join(timeout=30)
+                if process.is_alive():
+                    process.terminate()
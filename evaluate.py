@@ -0,0 +1,119 @@
+import csv
+import json
+import os
+import time
+
+import numpy as np
+from stable_baselines3 import PPO
+from stable_baselines3.common.vec_env import VecFrameStack
+
+from car_racing_env import make_training_vec_env
+from config import GRASS_DETECTION, N_STACK
+
+# --- Avaliação headless e paralela de um modelo salvo ---
+# Substitui o loop visual do test.py quando só os números importam: os
+# ambientes rodam em processos separados (render_mode="rgb_array", sem
+# janela), as sementes são fixas e o model.predict é chamado uma vez por
+# passo para todos os ambientes de avaliação.
+EVAL_EPISODES = 20
+EVAL_SEED = 1234
+
+
+def episode_quotas(n_episodes, n_envs):
+    # Mesma divisão do evaluate_policy do SB3: evita que ambientes com
+    # episódios curtos dominem a amostra
+    return np.array([(n_episodes + i) // n_envs for i in range(n_envs)], dtype=int)
+
+
+def evaluate_model(model, n_episodes=EVAL_EPISODES, n_envs=None, seed=EVAL_SEED, backend="shm",
+                   grass_detection=GRASS_DETECTION, deterministic=True):
+    """
+    Roda `n_episodes` episódios completos e devolve uma lista de dicts, um por
+    episódio, com retorno, duração e se terminou por sair da pista.
+
+    `model` pode ser um PPO já carregado ou o caminho de um .zip.
+    """
+    if isinstance(model, (str, os.PathLike)):
+        model = PPO.load(model, device="cpu")
+    n_envs = min(n_envs or os.cpu_count() or 4, n_episodes)
+
+    # Sem cache de pistas: a avaliação usa pistas geradas a partir das sementes fixas
+    vec_env = make_training_vec_env(n_envs=n_envs, backend=backend, grass_detection=grass_detection, seed=seed,
+                                    track_cache=None)
+    quotas = episode_quotas(n_episodes, n_envs)
+    counts = np.zeros(n_envs, dtype=int)
+    episodes = []
+    try:
+        vec_env = VecFrameStack(vec_env, n_stack=N_STACK)
+        obs = vec_env.reset()
+        while (counts < quotas).any():
+            actions, _ = model.predict(obs, deterministic=deterministic)
+            obs, _, dones, infos = vec_env.step(actions)
+            for env_idx in np.flatnonzero(dones):
+                if counts[env_idx] >= quotas[env_idx]:
+                    continue
+                episode_info = infos[env_idx]["episode"]
+                episodes.append({
+                    "env": int(env_idx),
+                    "episode": int(counts[env_idx]),
+                    "return": float(episode_info["r"]),
+                    "length": int(episode_info["l"]),
+                    "off_track": bool(infos[env_idx].get("off_track_by_grass", False)),
+                })
+                counts[env_idx] += 1
+    finally:
+        vec_env.close()
+    return episodes
+
+
+def summarize(episodes):
+    returns = np.array([episode["return"] for episode in episodes])
+    lengths = np.array([episode["length"] for episode in episodes])
+    off_track = np.array([episode["off_track"] for episode in episodes])
+    return {
+        "n_episodes": len(episodes),
+        "mean_return": float(returns.mean()),
+        "std_return": float(returns.std()),
+        "min_return": float(returns.min()),
+        "max_return": float(returns.max()),
+        "mean_length": float(lengths.mean()),
+        "off_track_rate": float(off_track.mean()),
+    }
+
+
+def save_results(episodes, summary, output_prefix):
+    directory = os.path.dirname(output_prefix)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(f"{output_prefix}.csv", "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["env", "episode", "return", "length", "off_track"])
+        writer.writeheader()
+        writer.writerows(episodes)
+    with open(f"{output_prefix}.json", "w") as f:
+        json.dump({"summary": summary, "episodes": episodes}, f, indent=2)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Avaliação headless e paralela de um modelo PPO do CarRacing.")
+    parser.add_argument("model_path", help="Arquivo .zip salvo pelo treinamento")
+    parser.add_argument("--episodes", type=int, default=EVAL_EPISODES)
+    parser.add_argument("--n-envs", type=int, default=None, help="Padrão: um ambiente por núcleo")
+    parser.add_argument("--seed", type=int, default=EVAL_SEED)
+    parser.add_argument("--backend", default="shm", choices=["dummy", "subproc", "shm"])
+    parser.add_argument("--output", default=None, help="Prefixo dos arquivos .csv/.json (padrão: ao lado do modelo)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    episodes = evaluate_model(args.model_path, n_episodes=args.episodes, n_envs=args.n_envs, seed=args.seed,
+                              backend=args.backend)
+    summary = summarize(episodes)
+    summary["wall_time_s"] = time.perf_counter() - start
+
+    output_prefix = args.output or os.path.splitext(args.model_path)[0] + "_eval"
+    save_results(episodes, summary, output_prefix)
+    print(f"Recompensa média: {summary['mean_return']:.2f} ± {summary['std_return']:.2f} "
+          f"em {summary['n_episodes']} episódios | duração média: {summary['mean_length']:.0f} passos | "
+          f"fora da pista: {summary['off_track_rate']:.0%} | {summary['wall_time_s']:.1f} s")
+    print(f"Resultados salvos em {output_prefix}.csv e {output_prefix}.json")
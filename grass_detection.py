@@ -0,0 +1,106 @@
+import time
+
+import numpy as np
+from gymnasium.envs.box2d.car_racing import STATE_H
+from stable_baselines3.common.vec_env import VecEnvWrapper
+
+# --- Parâmetros da Lógica de Término na Grama ---
+GRASS_PIXEL_THRESHOLD = 500 # Quantidade de pixels de grama para considerar "fora da pista"
+OFF_TRACK_PENALTY = -1000 # Penalidade severa por sair da pista
+# Modo "contact": número de rodas (de 4) sem contato com tiles da pista para
+# considerar "fora da pista". Faz o papel do GRASS_PIXEL_THRESHOLD do modo por pixels.
+OFF_TRACK_WHEEL_THRESHOLD = 4
+
+# A barra do HUD ocupa as últimas 5/40 linhas do frame (usado pelo pré-processamento)
+HUD_ROWS = round(STATE_H * 5 / 40)
+
+
+def count_grass_pixels(obs):
+    """
+    Pixels de grama de um frame (96, 96, 3) ou de um lote (n_envs, 96, 96, 3).
+    É a mesma heurística para o wrapper por ambiente e para a checagem em
+    lote, então os dois modos tomam sempre as mesmas decisões.
+    """
+    green_pixels = (obs[..., 1] > 180) & (obs[..., 0] < 100) & (obs[..., 2] < 100)
+    return np.count_nonzero(green_pixels, axis=(-2, -1))
+
+
+def count_off_track_wheels(env):
+    # O FrictionDetector do CarRacing mantém, em cada roda, o conjunto de tiles
+    # de pista em contato; roda sem tiles está na grama.
+    car = env.unwrapped.car
+    return sum(1 for wheel in car.wheels if not wheel.tiles)
+
+
+class VecGrassDetector(VecEnvWrapper):
+    """
+    Aplica a lógica de término na grama para todo o lote de ambientes de uma vez.
+
+    Deve ficar logo acima do VecEnv base (antes do VecFrameStack), com os
+    ambientes criados sem a checagem por ambiente do CustomCarRacingWrapper.
+    Como encerra episódios no nível do VecEnv, as estatísticas de episódio
+    devem vir de um VecMonitor colocado acima deste wrapper.
+    """
+
+    def __init__(self, venv, threshold=GRASS_PIXEL_THRESHOLD, penalty=OFF_TRACK_PENALTY):
+        super().__init__(venv)
+        self.threshold = threshold
+        self.penalty = penalty
+        self.check_time = 0.0 # Tempo acumulado na checagem (lido pelo PhaseTimingCallback)
+
+    def reset(self):
+        return self.venv.reset()
+
+    def step_wait(self):
+        obs, rewards, dones, infos = self.venv.step_wait()
+        check_start = time.perf_counter()
+        num_green_pixels = count_grass_pixels(obs)
+
+        # Ambientes que terminaram neste passo já foram resetados pelo VecEnv:
+        # a checagem deve olhar a observação terminal, como fazia o wrapper.
+        for env_idx in np.flatnonzero(dones):
+            num_green_pixels[env_idx] = count_grass_pixels(infos[env_idx]["terminal_observation"])
+
+        to_reset = []
+        for env_idx in np.flatnonzero(num_green_pixels > self.threshold):
+            rewards[env_idx] = self.penalty
+            infos[env_idx]["off_track_by_grass"] = True
+            infos[env_idx]["TimeLimit.truncated"] = False
+            if not dones[env_idx]:
+                dones[env_idx] = True
+                infos[env_idx]["terminal_observation"] = obs[env_idx].copy()
+                to_reset.append(int(env_idx))
+        if to_reset:
+            # Um único env_method para todos os ambientes que saíram da pista
+            # neste passo: os workers resetam em paralelo, numa só ida e volta
+            for env_idx, (reset_obs, _) in zip(to_reset, self.venv.env_method("reset", indices=to_reset)):
+                obs[env_idx] = reset_obs
+        self.check_time += time.perf_counter() - check_start
+        return obs, rewards, dones, infos
+
+
+if __name__ == "__main__":
+    import gymnasium as gym
+
+    # Custo da checagem em lote (VecGrassDetector) contra a mesma contagem
+    # feita frame a frame (CustomCarRacingWrapper), em frames reais.
+    N_ENVS, N_STEPS = 8, 300
+    envs = gym.vector.SyncVectorEnv([lambda: gym.make("CarRacing-v3", continuous=True)] * N_ENVS)
+    obs, _ = envs.reset(seed=0)
+    frames = []
+    for _ in range(N_STEPS):
+        obs, *_ = envs.step(envs.action_space.sample())
+        frames.append(obs.copy())
+    envs.close()
+
+    start = time.perf_counter()
+    per_frame = [[count_grass_pixels(frame) for frame in batch] for batch in frames]
+    per_frame_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batched = [count_grass_pixels(batch) for batch in frames]
+    batched_time = time.perf_counter() - start
+
+    assert np.array_equal(np.array(per_frame), np.array(batched))
+    print(f"Frame a frame: {per_frame_time / N_STEPS * 1e6:.0f} us/passo | "
+          f"em lote: {batched_time / N_STEPS * 1e6:.0f} us/passo ({per_frame_time / batched_time:.2f}x)")
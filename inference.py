@@ -0,0 +1,184 @@
+import json
+import time
+
+import numpy as np
+import torch
+from torch import nn
+
+# --- Inferência enxuta em CPU para políticas treinadas ---
+# Exporta o ramo determinístico do ator de um car_racing_*.zip para um módulo
+# TorchScript congelado (.pt), opcionalmente com quantização dinâmica int8
+# das camadas lineares. O InferenceEngine carrega esse arquivo sem importar o
+# Stable Baselines3 e reaproveita um buffer de entrada pré-alocado a cada passo.
+EXPORT_METADATA_FILE = "metadata.json"
+
+
+class DeterministicActor(nn.Module):
+    """
+    Mesmo cálculo do policy.predict(obs, deterministic=True) do SB3 para a
+    CnnPolicy com ações contínuas: uint8 (N, H, W, C) -> ações já recortadas
+    aos limites do espaço de ações.
+    """
+
+    def __init__(self, policy):
+        super().__init__()
+        self.features_extractor = policy.pi_features_extractor
+        self.policy_net = policy.mlp_extractor.policy_net
+        self.action_net = policy.action_net
+        self.register_buffer("low", torch.as_tensor(policy.action_space.low, dtype=torch.float32))
+        self.register_buffer("high", torch.as_tensor(policy.action_space.high, dtype=torch.float32))
+
+    def forward(self, obs):
+        # Observações dos VecEnvs vêm com canais por último; a CnnPolicy usa canais primeiro
+        x = obs.permute(0, 3, 1, 2).float() / 255.0
+        actions = self.action_net(self.policy_net(self.features_extractor(x)))
+        return torch.max(torch.min(actions, self.high), self.low)
+
+
+def channels_last_shape(observation_space):
+    # O SB3 guarda o espaço já transposto (VecTransposeImage); os VecEnvs entregam canais por último
+    from stable_baselines3.common.preprocessing import is_image_space_channels_first
+
+    shape = observation_space.shape
+    if is_image_space_channels_first(observation_space):
+        shape = (shape[1], shape[2], shape[0])
+    return tuple(shape)
+
+
+def export_policy(model_path, output_path, quantize=False):
+    """Converte um .zip do PPO num módulo TorchScript (.pt) e devolve seus metadados."""
+    from stable_baselines3 import PPO
+
+    model = PPO.load(model_path, device="cpu")
+    policy = model.policy.eval()
+    shape = channels_last_shape(policy.observation_space)
+
+    actor = DeterministicActor(policy).eval()
+    if quantize:
+        # Só as camadas lineares: as convoluções não têm versão dinâmica no torch
+        actor = torch.ao.quantization.quantize_dynamic(actor, {nn.Linear}, dtype=torch.qint8)
+    example = torch.zeros((1, *shape), dtype=torch.uint8)
+    with torch.no_grad():
+        module = torch.jit.freeze(torch.jit.trace(actor, example))
+
+    metadata = {
+        "observation_shape": list(shape),
+        "action_low": policy.action_space.low.tolist(),
+        "action_high": policy.action_space.high.tolist(),
+        "quantized": quantize,
+        "source": str(model_path),
+    }
+    torch.jit.save(module, output_path, _extra_files={EXPORT_METADATA_FILE: json.dumps(metadata)})
+    return metadata
+
+
+class InferenceEngine:
+    """
+    Carrega um módulo exportado por export_policy e calcula ações em lote.
+
+    predict tem a mesma assinatura do model.predict do SB3 (devolve
+    `(ações, None)`), então pode substituí-lo direto no test.py. O buffer de
+    entrada é alocado uma vez para `max_batch` observações e só cresce se
+    chegar um lote maior.
+    """
+
+    def __init__(self, path, max_batch=1, num_threads=None):
+        if num_threads is not None:
+            torch.set_num_threads(num_threads)
+        extra_files = {EXPORT_METADATA_FILE: ""}
+        self.module = torch.jit.load(path, map_location="cpu", _extra_files=extra_files)
+        self.metadata = json.loads(extra_files[EXPORT_METADATA_FILE])
+        self.observation_shape = tuple(self.metadata["observation_shape"])
+        self._buffer = torch.empty((max_batch, *self.observation_shape), dtype=torch.uint8)
+
+    def predict(self, obs, state=None, episode_start=None, deterministic=True):
+        # Só existe o caminho determinístico; os outros argumentos são aceitos pela compatibilidade
+        obs = np.asarray(obs, dtype=np.uint8)
+        single = obs.shape == self.observation_shape
+        if single:
+            obs = obs[np.newaxis]
+        n_obs = len(obs)
+        if n_obs > len(self._buffer):
+            self._buffer = torch.empty((n_obs, *self.observation_shape), dtype=torch.uint8)
+        batch = self._buffer[:n_obs]
+        batch.copy_(torch.from_numpy(obs))
+        with torch.inference_mode():
+            actions = self.module(batch).numpy()
+        return (actions[0] if single else actions), None
+
+
+def latency_percentiles(predict, observations, warmup=10):
+    """Latência por chamada (ms) de `predict` sobre cada lote de `observations`: p50 e p99."""
+    for obs in observations[:warmup]:
+        predict(obs)
+    latencies = []
+    for obs in observations:
+        start = time.perf_counter()
+        predict(obs)
+        latencies.append((time.perf_counter() - start) * 1e3)
+    p50, p99 = np.percentile(latencies, [50, 99])
+    return {"p50_ms": float(p50), "p99_ms": float(p99)}
+
+
+def compare_actions(reference_predict, predict, observations):
+    """Diferença absoluta entre as ações das duas funções sobre as mesmas observações."""
+    diffs = np.concatenate([
+        np.abs(reference_predict(obs) - predict(obs)).ravel() for obs in observations
+    ])
+    return {"max_abs_diff": float(diffs.max()), "mean_abs_diff": float(diffs.mean())}
+
+
+def collect_observations(model, n_steps, seed=0):
+    # Observações reais (ambiente de treinamento + frame stack), dirigidas pela própria política
+    from stable_baselines3.common.vec_env import VecFrameStack
+
+    from car_racing_env import make_training_vec_env
+    from config import N_STACK
+
+    vec_env = make_training_vec_env(n_envs=1, backend="dummy", seed=seed, track_cache=None)
+    vec_env = VecFrameStack(vec_env, n_stack=N_STACK)
+    observations = []
+    obs = vec_env.reset()
+    for _ in range(n_steps):
+        observations.append(obs.copy())
+        actions, _ = model.predict(obs, deterministic=True)
+        obs, _, _, _ = vec_env.step(actions)
+    vec_env.close()
+    return observations
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+
+    from stable_baselines3 import PPO
+
+    parser = argparse.ArgumentParser(description="Exporta um modelo PPO para inferência em CPU e mede latência/precisão.")
+    parser.add_argument("model_path", help="Arquivo .zip salvo pelo treinamento")
+    parser.add_argument("--output", default=None, help="Arquivo .pt (padrão: ao lado do modelo)")
+    parser.add_argument("--quantize", action="store_true", help="Quantização dinâmica int8 das camadas lineares")
+    parser.add_argument("--n-steps", type=int, default=500, help="Passos usados na medição")
+    parser.add_argument("--tolerance", type=float, default=None,
+                        help="Diferença máxima aceita nas ações (padrão: 1e-4, ou 0.05 com --quantize)")
+    args = parser.parse_args()
+
+    output_path = args.output or os.path.splitext(args.model_path)[0] + ("_int8.pt" if args.quantize else ".pt")
+    export_policy(args.model_path, output_path, quantize=args.quantize)
+    print(f"Módulo exportado para {output_path} ({os.path.getsize(output_path) / 2**20:.1f} MiB)")
+
+    torch.set_num_threads(1) # Latência de um passo, como no test.py
+    model = PPO.load(args.model_path, device="cpu")
+    engine = InferenceEngine(output_path)
+    observations = collect_observations(model, args.n_steps)
+
+    sb3_predict = lambda obs: model.predict(obs, deterministic=True)[0]
+    engine_predict = lambda obs: engine.predict(obs)[0]
+    for name, predict in (("SB3 model.predict", sb3_predict), ("InferenceEngine", engine_predict)):
+        stats = latency_percentiles(predict, observations)
+        print(f"{name:<18} p50 {stats['p50_ms']:.3f} ms | p99 {stats['p99_ms']:.3f} ms")
+
+    tolerance = args.tolerance if args.tolerance is not None else (0.05 if args.quantize else 1e-4)
+    accuracy = compare_actions(sb3_predict, engine_predict, observations)
+    status = "ok" if accuracy["max_abs_diff"] <= tolerance else "ACIMA DA TOLERÂNCIA"
+    print(f"Diferença nas ações: máx {accuracy['max_abs_diff']:.2e} | média {accuracy['mean_abs_diff']:.2e} "
+          f"(tolerância {tolerance:.0e}): {status}")
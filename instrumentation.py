@@ -0,0 +1,168 @@
+import functools
+import sys
+import time
+
+try:
+    import resource
+except ImportError: # Windows: sem getrusage, o pico de memória do processo não é registrado
+    resource = None
+
+from stable_baselines3.common.callbacks import BaseCallback
+from stable_baselines3.common.vec_env import VecEnvWrapper
+
+from grass_detection import VecGrassDetector
+from rollout_buffers import rollout_buffer_nbytes
+
+
+def _worker_peak_rss_bytes(processes):
+    # VmHWM é o pico de memória residente do processo (Linux)
+    total = 0
+    for process in processes:
+        try:
+            with open(f"/proc/{process.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        total += int(line.split()[1]) * 1024
+                        break
+        except (FileNotFoundError, ProcessLookupError):
+            continue
+    return total
+
+
+class PhaseTimingCallback(BaseCallback):
+    """
+    Divide o tempo de parede do model.learn por fase e registra no logger do
+    modelo (e portanto no TensorBoard em ./car_racing_ppo_tensorboard/):
+
+    - timing/env_step_s: env.step do VecEnv, sem a checagem de grama em lote
+    - timing/grass_check_s: checagem de grama em lote (VecGrassDetector), no
+      processo principal
+    - timing/grass_check_workers_cpu_s: no lugar da anterior quando a checagem
+      roda no CustomCarRacingWrapper de cada worker; é tempo de CPU somado
+      entre ambientes em paralelo, já contido no env_step, e fica fora da
+      divisão do tempo de parede (e do simulation_fraction)
+    - timing/inference_s: forward da política durante o rollout
+    - timing/gae_s: cálculo de retornos e vantagens
+    - timing/train_s: atualizações de gradiente (model.train)
+    - timing/checkpoint_s: escrita de checkpoints (o CheckpointCallback passado)
+
+    Os tempos são medidos envolvendo esses métodos com dois perf_counter por
+    chamada, e registrados uma vez por rollout. O train() roda entre o fim de
+    um rollout e o início do próximo, então o train_s registrado é o da
+    iteração anterior. Os métodos medidos (step do VecEnv, forward da
+    política, compute_returns_and_advantage do rollout buffer e _on_step do
+    callback de checkpoint) são trocados por versões cronometradas como
+    atributos das instâncias. Nenhum desses atributos vai para o .zip: a
+    política é salva pelo state_dict, e o VecEnv e o rollout buffer ficam fora
+    do model.save. Já um atributo novo no próprio modelo seria salvo, por isso
+    o modelo em si não é alterado.
+    """
+
+    PHASES = ("env_step", "grass_check", "inference", "gae", "train", "checkpoint")
+
+    def __init__(self, checkpoint_callback=None, verbose=0):
+        super().__init__(verbose)
+        self.checkpoint_callback = checkpoint_callback
+        self._totals = dict.fromkeys(self.PHASES, 0.0)
+        self._last_grass_time = 0.0
+        self._last_record = None
+        self._rollout_end = None
+
+    def _timed(self, obj, method_name, phase):
+        method = getattr(obj, method_name)
+
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self._totals[phase] += time.perf_counter() - start
+
+        setattr(obj, method_name, wrapper)
+
+    def _vec_env_stacks(self):
+        # Na coleta em pipeline cada grupo do GroupedVecEnv tem sua própria pilha de wrappers
+        return getattr(self.training_env, "groups", [self.training_env])
+
+    def _find_vec_wrappers(self, wrapper_class):
+        found = []
+        for venv in self._vec_env_stacks():
+            while isinstance(venv, VecEnvWrapper):
+                if isinstance(venv, wrapper_class):
+                    found.append(venv)
+                venv = venv.venv
+        return found
+
+    def _base_vec_envs(self):
+        bases = []
+        for venv in self._vec_env_stacks():
+            while isinstance(venv, VecEnvWrapper):
+                venv = venv.venv
+            bases.append(venv)
+        return bases
+
+    def _grass_check_time(self):
+        detectors = self._find_vec_wrappers(VecGrassDetector)
+        if detectors:
+            return sum(detector.check_time for detector in detectors)
+        try:
+            return sum(self.training_env.get_attr("grass_check_time"))
+        except AttributeError:
+            return 0.0
+
+    def _init_callback(self):
+        self._timed(self.training_env, "step", "env_step")
+        if hasattr(self.training_env, "step_group_wait"):
+            # Coleta em pipeline: conta o tempo em que a coleta ficou esperando a simulação
+            self._timed(self.training_env, "step_group_wait", "env_step")
+        self._timed(self.model.policy, "forward", "inference")
+        self._timed(self.model.rollout_buffer, "compute_returns_and_advantage", "gae")
+        if self.checkpoint_callback is not None:
+            self._timed(self.checkpoint_callback, "_on_step", "checkpoint")
+        self._last_grass_time = self._grass_check_time()
+        self._last_record = time.perf_counter()
+
+    def _on_rollout_start(self):
+        if self._rollout_end is not None:
+            self._totals["train"] += time.perf_counter() - self._rollout_end
+
+    def _on_step(self):
+        return True
+
+    def _on_rollout_end(self):
+        now = time.perf_counter()
+        grass_time = self._grass_check_time()
+        grass_delta = grass_time - self._last_grass_time
+        totals = dict(self._totals)
+        if self._find_vec_wrappers(VecGrassDetector):
+            # A checagem em lote roda dentro do env.step; não conta duas vezes
+            totals["grass_check"] = grass_delta
+            totals["env_step"] -= grass_delta
+        else:
+            # Soma entre workers paralelos: não é tempo de parede do processo principal
+            del totals["grass_check"]
+            self.logger.record("timing/grass_check_workers_cpu_s", grass_delta)
+
+        wall_time = now - self._last_record
+        for phase, seconds in totals.items():
+            self.logger.record(f"timing/{phase}_s", seconds)
+        self.logger.record("timing/wall_s", wall_time)
+        if wall_time > 0:
+            simulation = totals["env_step"] + totals.get("grass_check", 0.0)
+            self.logger.record("timing/simulation_fraction", simulation / wall_time)
+            self.logger.record("timing/learning_fraction", (totals["inference"] + totals["gae"] + totals["train"]) / wall_time)
+
+        if resource is not None:
+            # ru_maxrss vem em KiB no Linux e em bytes no macOS
+            peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            self.logger.record("memory/peak_rss_mb", peak_rss / 2**20 if sys.platform == "darwin" else peak_rss / 1024)
+        processes = [process for venv in self._base_vec_envs() for process in getattr(venv, "processes", [])]
+        if processes:
+            self.logger.record("memory/workers_peak_rss_mb", _worker_peak_rss_bytes(processes) / 2**20)
+        self.logger.record("memory/rollout_buffer_mb", rollout_buffer_nbytes(self.model.rollout_buffer) / 2**20)
+
+        self._totals = dict.fromkeys(self.PHASES, 0.0)
+        self._last_grass_time = grass_time
+        self._last_record = now
+        self._rollout_end = time.perf_counter()
@@ -0,0 +1,153 @@
+import numpy as np
+import pygame
+from gymnasium import spaces
+from gymnasium.core import Wrapper
+from gymnasium.envs.box2d.car_racing import SCALE, WINDOW_H, WINDOW_W, ZOOM
+
+from preprocessing import rgb_to_gray
+
+# --- Renderização nativa em baixa resolução para o treinamento ---
+# O CarRacing desenha cada observação numa superfície de 1000x800 com
+# anti-aliasing, textos e HUD, e depois a reduz para 96x96; o pré-processamento
+# ainda recorta o HUD e reduz para 64x64. Aqui a observação é desenhada
+# direto no tamanho final: só o campo de jogo (sem HUD), sem anti-aliasing e
+# com uma paleta de poucas cores chapadas (grama, pista, zebra, carro).
+PLAYFIELD_FRACTION = 35 / 40 # Parte da janela acima do HUD
+PALETTE = {
+    "grass": (102, 204, 102),
+    "road": (102, 102, 102),
+    "kerb": (255, 255, 255),
+    "hull": (204, 0, 0),
+    "wheel": (0, 0, 0),
+}
+_KERB_COLORS = {(255, 255, 255), (255, 0, 0)}
+
+def _gray_palette(palette):
+    # Mesma conversão do VecObservationPreprocessor: o cinza das duas pilhas é idêntico
+    return {name: (int(rgb_to_gray(np.array(color, dtype=np.uint8))),) * 3 for name, color in palette.items()}
+
+
+class LowResRenderWrapper(Wrapper):
+    """
+    Substitui o CarRacing._render da observação ("state_pixels") por um
+    desenho direto em `size`x`size`, sem HUD e com paleta simplificada.
+    Com `grayscale`, a observação sai com um canal, pronta para o VecFrameStack.
+
+    Com `skip_render`, o render() opcional (rgb_array/human) não desenha nada
+    e devolve None; sem ele, continua usando o render original do CarRacing
+    (o test.py precisa da janela "human").
+
+    Sem HUD os modos de detecção de grama por pixels não funcionam: use o modo
+    "contact" do CustomCarRacingWrapper.
+    """
+
+    def __init__(self, env, size=64, grayscale=True, skip_render=True):
+        super().__init__(env)
+        self.size = size
+        self.grayscale = grayscale
+        self.skip_render = skip_render
+        self.palette = _gray_palette(PALETTE) if grayscale else dict(PALETTE)
+        channels = 1 if grayscale else 3
+        self.observation_space = spaces.Box(low=0, high=255, shape=(size, size, channels), dtype=np.uint8)
+
+        # Janela -> pixel da observação (inclui a inversão vertical que o CarRacing faz)
+        self._scale = np.array([size / WINDOW_W, -size / (WINDOW_H * PLAYFIELD_FRACTION)])
+        self._offset = np.array([0.0, size / PLAYFIELD_FRACTION])
+        self._surface = pygame.Surface((size, size))
+        self._road_poly = None # Lista de polígonos da pista já convertida (muda a cada reset)
+
+        car_racing = self.env.unwrapped
+        self._original_render = car_racing._render
+        car_racing._render = self._render
+        # O PassiveEnvChecker do gym.make confere as observações com o espaço do ambiente base
+        car_racing.observation_space = self.observation_space
+
+    def _render(self, mode):
+        if mode == "state_pixels":
+            return self._render_observation()
+        if self.skip_render:
+            return None
+        return self._original_render(mode)
+
+    def _cache_road(self, car_racing):
+        # Vértices da pista e das zebras num único array, separados uma vez por reset
+        self._road_poly = car_racing.road_poly
+        road, kerbs = [], []
+        for poly, color in car_racing.road_poly:
+            (kerbs if tuple(int(c) for c in color) in _KERB_COLORS else road).append(poly)
+        self._road = np.array(road, dtype=np.float64).reshape(-1, 4, 2)
+        self._kerbs = np.array(kerbs, dtype=np.float64).reshape(-1, 4, 2)
+
+    def _to_pixels(self, points, rotation, zoom, translation):
+        window = points @ rotation.T * zoom + translation
+        return window * self._scale + self._offset
+
+    def _draw_polygons(self, polys, color):
+        # Descarta os polígonos sem nenhum vértice perto da observação antes de
+        # desenhar; a margem cobre tiles que cruzam um canto sem vértice dentro
+        margin = self.size / 4
+        visible = ((polys >= -margin) & (polys <= self.size + margin)).all(axis=2).any(axis=1)
+        for poly in polys[visible]:
+            pygame.draw.polygon(self._surface, color, poly.tolist())
+
+    def _render_observation(self):
+        car_racing = self.env.unwrapped
+        if car_racing.road_poly is not self._road_poly:
+            self._cache_road(car_racing)
+
+        # Mesma câmera do CarRacing._render (inclusive o zoom animado do primeiro segundo)
+        angle = -car_racing.car.hull.angle
+        zoom = 0.1 * SCALE * max(1 - car_racing.t, 0) + ZOOM * SCALE * min(car_racing.t, 1)
+        cos, sin = np.cos(angle), np.sin(angle)
+        rotation = np.array([[cos, -sin], [sin, cos]])
+        position = np.array(car_racing.car.hull.position)
+        translation = -(rotation @ position) * zoom + np.array([WINDOW_W / 2, WINDOW_H / 4])
+
+        self._surface.fill(self.palette["grass"])
+        self._draw_polygons(self._to_pixels(self._road, rotation, zoom, translation), self.palette["road"])
+        self._draw_polygons(self._to_pixels(self._kerbs, rotation, zoom, translation), self.palette["kerb"])
+        car = car_racing.car
+        for body, color in [(wheel, self.palette["wheel"]) for wheel in car.wheels] + [(car.hull, self.palette["hull"])]:
+            for fixture in body.fixtures:
+                vertices = np.array([body.transform * v for v in fixture.shape.vertices])
+                pixels = self._to_pixels(vertices, rotation, zoom, translation)
+                pygame.draw.polygon(self._surface, color, pixels.tolist())
+
+        frame = pygame.surfarray.pixels3d(self._surface)
+        if self.grayscale:
+            # Paleta cinza: os três canais são iguais
+            return np.ascontiguousarray(frame[:, :, :1].transpose(1, 0, 2))
+        return np.ascontiguousarray(frame.transpose(1, 0, 2))
+
+    def close(self):
+        self.env.unwrapped._render = self._original_render
+        return super().close()
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    import gymnasium as gym
+
+    parser = argparse.ArgumentParser(description="Compara o custo do step com a renderização padrão e a nativa.")
+    parser.add_argument("--n-steps", type=int, default=500)
+    parser.add_argument("--size", type=int, default=64)
+    args = parser.parse_args()
+
+    step_times = {}
+    for name, native in (("padrão", False), ("nativa", True)):
+        env = gym.make("CarRacing-v3", continuous=True, render_mode="rgb_array")
+        if native:
+            env = LowResRenderWrapper(env, size=args.size)
+        env.action_space.seed(0)
+        env.reset(seed=0)
+        start = time.perf_counter()
+        for _ in range(args.n_steps):
+            obs, _, terminated, truncated, _ = env.step(env.action_space.sample())
+            if terminated or truncated:
+                env.reset()
+        step_times[name] = (time.perf_counter() - start) / args.n_steps
+        print(f"{name}: {step_times[name] * 1e3:.2f} ms por step, observação {obs.shape}")
+        env.close()
+    print(f"Ganho: {step_times['padrão'] / step_times['nativa']:.2f}x")
@@ -0,0 +1,260 @@
+import numpy as np
+import torch as th
+from gymnasium import spaces
+from stable_baselines3 import PPO
+from stable_baselines3.common.utils import obs_as_tensor
+from stable_baselines3.common.vec_env import VecEnv, VecFrameStack, VecTransposeImage
+
+# --- Coleta de rollouts em pipeline (estilo modo assíncrono do EnvPool) ---
+# Os ambientes são divididos em grupos, cada um com sua pilha completa de
+# wrappers (VecEnv multiprocesso, grama, pré-processamento, frame stack).
+# Enquanto um grupo simula, a política roda para o próximo: o forward da
+# CnnPolicy e o passo dos ambientes deixam de se alternar estritamente.
+
+
+def bootstrap_truncated(policy, gamma, rewards, dones, infos):
+    # Mesmo tratamento de episódios truncados por tempo da coleta padrão do SB3:
+    # soma à recompensa o valor descontado da observação terminal
+    for idx, done in enumerate(dones):
+        if (
+            done
+            and infos[idx].get("terminal_observation") is not None
+            and infos[idx].get("TimeLimit.truncated", False)
+        ):
+            terminal_obs = policy.obs_to_tensor(infos[idx]["terminal_observation"])[0]
+            with th.no_grad():
+                terminal_value = policy.predict_values(terminal_obs)[0]
+            rewards[idx] += gamma * terminal_value
+
+class GroupedVecEnv(VecEnv):
+    """
+    Junta vários VecEnvs independentes num único VecEnv (índices concatenados).
+
+    O step() comum anda com todos os grupos em lockstep; o PipelinedPPO usa
+    step_group_async/step_group_wait para escalonar cada grupo separadamente.
+    """
+
+    def __init__(self, groups):
+        self.groups = list(groups)
+        sizes = [group.num_envs for group in self.groups]
+        bounds = np.cumsum([0, *sizes])
+        self.slices = [slice(start, stop) for start, stop in zip(bounds[:-1], bounds[1:])]
+        super().__init__(int(bounds[-1]), self.groups[0].observation_space, self.groups[0].action_space)
+
+    def reset(self):
+        return np.concatenate([group.reset() for group in self.groups])
+
+    def step_group_async(self, group_idx, actions):
+        self.groups[group_idx].step_async(actions)
+
+    def step_group_wait(self, group_idx):
+        return self.groups[group_idx].step_wait()
+
+    def step_async(self, actions):
+        for group_idx, group_slice in enumerate(self.slices):
+            self.step_group_async(group_idx, actions[group_slice])
+
+    def step_wait(self):
+        results = [self.step_group_wait(group_idx) for group_idx in range(len(self.groups))]
+        obs, rewards, dones, infos = zip(*results)
+        return np.concatenate(obs), np.concatenate(rewards), np.concatenate(dones), sum(map(list, infos), [])
+
+    def close(self):
+        for group in self.groups:
+            group.close()
+
+    def seed(self, seed=None):
+        # Cada grupo recebe sementes consecutivas a partir do seu primeiro índice global
+        for group, group_slice in zip(self.groups, self.slices):
+            group.seed(None if seed is None else seed + group_slice.start)
+
+    def _group_targets(self, indices):
+        indices = self._get_indices(indices)
+        for group, group_slice in zip(self.groups, self.slices):
+            local = [i - group_slice.start for i in indices if group_slice.start <= i < group_slice.stop]
+            if local:
+                yield group, local
+
+    def get_attr(self, attr_name, indices=None):
+        return [value for group, local in self._group_targets(indices) for value in group.get_attr(attr_name, local)]
+
+    def set_attr(self, attr_name, value, indices=None):
+        for group, local in self._group_targets(indices):
+            group.set_attr(attr_name, value, local)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        return [
+            result
+            for group, local in self._group_targets(indices)
+            for result in group.env_method(method_name, *method_args, indices=local, **method_kwargs)
+        ]
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [flag for group, local in self._group_targets(indices) for flag in group.env_is_wrapped(wrapper_class, local)]
+
+    def get_images(self):
+        return [image for group in self.groups for image in group.get_images()]
+
+
+def make_grouped_vec_env(make_group_vec_env, n_envs, n_groups, n_stack, seed=0):
+    """
+    `make_group_vec_env(n_envs, seed)` cria a pilha de um grupo até antes do
+    frame stack. O VecTransposeImage é aplicado por grupo para o SB3 não
+    precisar envolver o GroupedVecEnv.
+
+    Nunca há mais grupos que ambientes: com um único ambiente (máquina de um
+    núcleo, por exemplo) sobra um grupo só e a coleta fica sequencial.
+    """
+    if n_envs < 1:
+        raise ValueError(f"A coleta em pipeline precisa de pelo menos um ambiente: {n_envs}")
+    n_groups = max(1, min(n_groups, n_envs))
+    sizes = [n_envs // n_groups + (i < n_envs % n_groups) for i in range(n_groups)]
+    groups, offset = [], 0
+    try:
+        for size in sizes:
+            group = VecFrameStack(make_group_vec_env(n_envs=size, seed=seed + offset), n_stack=n_stack)
+            groups.append(VecTransposeImage(group))
+            offset += size
+    except BaseException:
+        # Sem isso, os workers e a memória compartilhada dos grupos já criados ficariam órfãos
+        for group in groups:
+            group.close()
+        raise
+    return GroupedVecEnv(groups)
+
+
+class PipelinedPPO(PPO):
+    """
+    PPO cuja coleta de rollouts sobrepõe inferência e simulação entre grupos
+    de ambientes de um GroupedVecEnv. Com outro tipo de VecEnv, usa a coleta
+    padrão (lockstep).
+
+    O rollout buffer recebe exatamente as mesmas transições que na coleta
+    padrão: a diferença é só a ordem em que os grupos são atendidos.
+    """
+
+    def _group_policy_step(self, obs):
+        with th.no_grad():
+            actions, values, log_probs = self.policy(obs_as_tensor(obs, self.device))
+        actions = actions.cpu().numpy()
+        clipped_actions = actions
+        if isinstance(self.action_space, spaces.Box):
+            if self.policy.squash_output:
+                clipped_actions = self.policy.unscale_action(clipped_actions)
+            else:
+                clipped_actions = np.clip(actions, self.action_space.low, self.action_space.high)
+        return actions, clipped_actions, values, log_probs
+
+    def collect_rollouts(self, env, callback, rollout_buffer, n_rollout_steps):
+        if not isinstance(env, GroupedVecEnv):
+            return super().collect_rollouts(env, callback, rollout_buffer, n_rollout_steps)
+
+        assert self._last_obs is not None, "No previous observation was provided"
+        self.policy.set_training_mode(False)
+        rollout_buffer.reset()
+        if self.use_sde:
+            self.policy.reset_noise(env.num_envs)
+        callback.on_rollout_start()
+
+        n_groups = len(env.groups)
+        pending = [None] * n_groups
+        last_obs = [self._last_obs[group_slice] for group_slice in env.slices]
+        last_starts = [self._last_episode_starts[group_slice] for group_slice in env.slices]
+
+        # Dispara o primeiro passo de todos os grupos
+        for group_idx in range(n_groups):
+            actions, clipped_actions, values, log_probs = self._group_policy_step(last_obs[group_idx])
+            env.step_group_async(group_idx, clipped_actions)
+            pending[group_idx] = (actions, values, log_probs)
+
+        n_steps = 0
+        while n_steps < n_rollout_steps:
+            step_results = []
+            for group_idx in range(n_groups):
+                new_obs, rewards, dones, infos = env.step_group_wait(group_idx)
+                step_results.append((last_obs[group_idx], last_starts[group_idx], *pending[group_idx],
+                                     new_obs, rewards, dones, infos))
+                last_obs[group_idx], last_starts[group_idx] = new_obs, dones
+                # Enquanto este grupo volta a simular, o laço segue para o próximo
+                if n_steps + 1 < n_rollout_steps:
+                    actions, clipped_actions, values, log_probs = self._group_policy_step(new_obs)
+                    env.step_group_async(group_idx, clipped_actions)
+                    pending[group_idx] = (actions, values, log_probs)
+
+            (obs, episode_starts, actions, values, log_probs,
+             new_obs, rewards, dones, infos) = zip(*step_results)
+            obs, episode_starts, actions = np.concatenate(obs), np.concatenate(episode_starts), np.concatenate(actions)
+            values, log_probs = th.cat(values), th.cat(log_probs)
+            new_obs, rewards, dones = np.concatenate(new_obs), np.concatenate(rewards), np.concatenate(dones)
+            infos = sum(map(list, infos), [])
+
+            self.num_timesteps += env.num_envs
+            callback.update_locals(locals())
+            if not callback.on_step():
+                # Esvazia os passos já disparados antes de abortar
+                if n_steps + 1 < n_rollout_steps:
+                    for group_idx in range(n_groups):
+                        env.step_group_wait(group_idx)
+                return False
+
+            self._update_info_buffer(infos, dones)
+            n_steps += 1
+            if isinstance(self.action_space, spaces.Discrete):
+                actions = actions.reshape(-1, 1)
+            bootstrap_truncated(self.policy, self.gamma, rewards, dones, infos)
+            rollout_buffer.add(obs, actions, rewards, episode_starts, values, log_probs)
+            self._last_obs = new_obs
+            self._last_episode_starts = dones
+
+        with th.no_grad():
+            values = self.policy.predict_values(obs_as_tensor(new_obs, self.device))
+        rollout_buffer.compute_returns_and_advantage(last_values=values, dones=dones)
+
+        callback.update_locals(locals())
+        callback.on_rollout_end()
+        return True
+
+
+def benchmark_rollout_modes(make_group_vec_env, n_envs, n_groups, n_stack, n_steps=256, **ppo_kwargs):
+    """Passos de ambiente por segundo na coleta lockstep (1 grupo) e em pipeline."""
+    import time
+
+    from stable_baselines3.common.callbacks import CallbackList
+    from stable_baselines3.common.logger import configure
+
+    results = {}
+    for mode, groups in (("lockstep", 1), ("pipelined", n_groups)):
+        vec_env = make_grouped_vec_env(make_group_vec_env, n_envs, groups, n_stack)
+        if groups == 1:
+            # Coleta padrão do SB3 sobre a pilha de wrappers de sempre
+            vec_env = vec_env.groups[0]
+        model = PipelinedPPO("CnnPolicy", vec_env, n_steps=n_steps, device="cpu", **ppo_kwargs)
+        model.set_logger(configure(folder=None, format_strings=[]))
+        model._last_obs = vec_env.reset()
+        model._last_episode_starts = np.ones((vec_env.num_envs,), dtype=bool)
+        callback = CallbackList([])
+        callback.init_callback(model)
+        model.collect_rollouts(vec_env, callback, model.rollout_buffer, n_rollout_steps=8) # aquecimento
+        start = time.perf_counter()
+        model.collect_rollouts(vec_env, callback, model.rollout_buffer, n_rollout_steps=n_steps)
+        results[mode] = n_steps * vec_env.num_envs / (time.perf_counter() - start)
+        vec_env.close()
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from car_racing_env import make_training_vec_env
+    from config import N_ENVS, N_ENV_GROUPS, N_STACK
+
+    parser = argparse.ArgumentParser(description="Compara a coleta de rollouts lockstep com a coleta em pipeline.")
+    parser.add_argument("--n-envs", type=int, default=N_ENVS)
+    parser.add_argument("--n-groups", type=int, default=N_ENV_GROUPS)
+    parser.add_argument("--n-steps", type=int, default=256)
+    args = parser.parse_args()
+
+    results = benchmark_rollout_modes(make_training_vec_env, args.n_envs, args.n_groups, N_STACK, n_steps=args.n_steps)
+    for mode, steps_per_sec in results.items():
+        print(f"{mode:>9}: {steps_per_sec:9.1f} passos/s")
+    print(f"Ganho do pipeline: {results['pipelined'] / results['lockstep']:.2f}x")
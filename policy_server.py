@@ -0,0 +1,360 @@
+import json
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+# --- Servidor local de política com micro-batching ---
+# Um único processo carrega o checkpoint (.zip do PPO ou .pt do inference.py)
+# e atende vários clientes por socket Unix ou TCP em localhost. Os pedidos
+# que chegam dentro de `max_wait` são juntados num lote e resolvidos com um
+# único forward da CnnPolicy.
+#
+# Protocolo (inteiros big-endian):
+#   conexão: servidor envia u32 tamanho + JSON {"observation_shape", "action_dim"}
+#   pedido:  cliente envia u32 n_obs + n_obs observações uint8 (H, W, C)
+#   resposta: n_obs * action_dim float32
+DEFAULT_ADDRESS = "/tmp/car_racing_policy.sock"
+DEFAULT_MAX_BATCH = 32
+DEFAULT_MAX_WAIT_MS = 2.0
+# Hosts aceitos no modo TCP sem --allow-remote: o protocolo não tem autenticação
+LOOPBACK_HOSTS = ("127.0.0.1", "localhost", "::1")
+_HEADER = struct.Struct("!I")
+
+
+def parse_address(address):
+    # "host:porta" é TCP; qualquer outra coisa é o caminho de um socket Unix
+    if isinstance(address, str) and ":" in address:
+        host, port = address.rsplit(":", 1)
+        return host, int(port)
+    return address
+
+
+def recv_exact(sock, n_bytes):
+    data = bytearray(n_bytes)
+    view = memoryview(data)
+    received = 0
+    while received < n_bytes:
+        chunk = sock.recv_into(view[received:])
+        if chunk == 0:
+            raise ConnectionError("Conexão fechada pelo outro lado")
+        received += chunk
+    return data
+
+
+def load_policy(model_path):
+    """Devolve (predict, observation_shape, action_dim) para um .pt exportado ou um .zip do PPO."""
+    if model_path.endswith(".pt"):
+        from inference import InferenceEngine
+
+        engine = InferenceEngine(model_path, max_batch=DEFAULT_MAX_BATCH)
+        return lambda obs: engine.predict(obs)[0], engine.observation_shape, len(engine.metadata["action_low"])
+
+    from stable_baselines3 import PPO
+
+    from inference import channels_last_shape
+
+    model = PPO.load(model_path, device="cpu")
+    predict = lambda obs: model.predict(obs, deterministic=True)[0]
+    return predict, channels_last_shape(model.observation_space), model.action_space.shape[0]
+
+
+class ServerMetrics:
+    """Contadores do servidor; latências guardadas numa janela das últimas `window` requisições."""
+
+    def __init__(self, window=10000):
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+        self.requests = 0
+        self.observations = 0
+        self.batches = 0
+        self.forward_time = 0.0
+        self._latencies = deque(maxlen=window)
+
+    def record_batch(self, n_obs, forward_time, latencies):
+        with self._lock:
+            self.batches += 1
+            self.requests += len(latencies)
+            self.observations += n_obs
+            self.forward_time += forward_time
+            self._latencies.extend(latencies)
+
+    def summary(self):
+        with self._lock:
+            elapsed = time.perf_counter() - self._start
+            latencies = np.array(self._latencies) * 1e3
+            summary = {
+                "requests": self.requests,
+                "observations": self.observations,
+                "batches": self.batches,
+                "mean_batch_size": self.observations / self.batches if self.batches else 0.0,
+                "mean_forward_ms": self.forward_time / self.batches * 1e3 if self.batches else 0.0,
+                "throughput_obs_per_s": self.observations / elapsed if elapsed > 0 else 0.0,
+            }
+        if len(latencies):
+            summary["latency_p50_ms"], summary["latency_p99_ms"] = map(float, np.percentile(latencies, [50, 99]))
+        return summary
+
+
+class _Request:
+    def __init__(self, obs):
+        self.obs = obs
+        self.enqueued = time.perf_counter()
+        self.done = threading.Event()
+        self.actions = None
+        self.error = None
+
+
+class MicroBatcher:
+    """
+    Junta pedidos de vários clientes num lote: o primeiro pedido abre uma
+    janela de `max_wait` segundos, que fecha antes se o lote chegar a
+    `max_batch` observações. Um único thread chama `predict`, então o modelo
+    nunca roda em paralelo consigo mesmo.
+    """
+
+    def __init__(self, predict, max_batch=DEFAULT_MAX_BATCH, max_wait=DEFAULT_MAX_WAIT_MS / 1e3):
+        self.predict = predict
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.metrics = ServerMetrics()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, obs):
+        request = _Request(obs)
+        self._queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.actions
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self, first):
+        batch, n_obs = [first], len(first.obs)
+        deadline = time.perf_counter() + self.max_wait
+        while n_obs < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if request is None:
+                # Repassa o sinal de parada para depois deste lote
+                self._queue.put(None)
+                break
+            batch.append(request)
+            n_obs += len(request.obs)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = self._collect(first)
+            try:
+                start = time.perf_counter()
+                actions = self.predict(np.concatenate([request.obs for request in batch]))
+                forward_time = time.perf_counter() - start
+            except Exception as e:
+                for request in batch:
+                    request.error = e
+                    request.done.set()
+                continue
+
+            offset = 0
+            finished = time.perf_counter()
+            for request in batch:
+                request.actions = np.ascontiguousarray(actions[offset:offset + len(request.obs)], dtype=np.float32)
+                offset += len(request.obs)
+                request.done.set()
+            self.metrics.record_batch(offset, forward_time, [finished - request.enqueued for request in batch])
+
+
+class _PolicyRequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        server = self.server
+        handshake = json.dumps({"observation_shape": server.observation_shape, "action_dim": server.action_dim})
+        self.request.sendall(_HEADER.pack(len(handshake)) + handshake.encode())
+        obs_nbytes = int(np.prod(server.observation_shape))
+        while True:
+            try:
+                (n_obs,) = _HEADER.unpack(recv_exact(self.request, _HEADER.size))
+                # O n_obs vem do cliente: sem o limite, um cabeçalho malformado faria
+                # o servidor alocar um buffer de tamanho arbitrário
+                if not 0 < n_obs <= server.batcher.max_batch:
+                    print(f"Pedido recusado: {n_obs} observações (limite {server.batcher.max_batch}); "
+                          f"conexão encerrada", flush=True)
+                    return
+                # recv_exact devolve exatamente n_obs * obs_nbytes bytes ou falha
+                data = recv_exact(self.request, n_obs * obs_nbytes)
+            except ConnectionError:
+                return
+            obs = np.frombuffer(data, dtype=np.uint8).reshape(n_obs, *server.observation_shape)
+            actions = server.batcher.submit(obs)
+            self.request.sendall(actions.tobytes())
+
+
+class _UnixPolicyServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+class _TCPPolicyServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def make_server(model_path, address=DEFAULT_ADDRESS, max_batch=DEFAULT_MAX_BATCH, max_wait_ms=DEFAULT_MAX_WAIT_MS,
+                allow_remote=False):
+    """
+    No modo TCP o servidor só escuta em localhost (":porta" vira
+    127.0.0.1:porta); outro host exige `allow_remote=True`.
+    """
+    address = parse_address(address)
+    if isinstance(address, tuple):
+        host, port = address
+        host = host or "127.0.0.1"
+        if host not in LOOPBACK_HOSTS and not allow_remote:
+            raise ValueError(f"O servidor de política só escuta em localhost; para {host} use allow_remote=True "
+                             f"(--allow-remote), e só em rede confiável")
+        address = (host, port)
+    predict, observation_shape, action_dim = load_policy(model_path)
+    if isinstance(address, tuple):
+        server = _TCPPolicyServer(address, _PolicyRequestHandler)
+    else:
+        if os.path.exists(address):
+            os.unlink(address) # Socket deixado por uma execução anterior
+        server = _UnixPolicyServer(address, _PolicyRequestHandler)
+    server.observation_shape = list(observation_shape)
+    server.action_dim = action_dim
+    server.batcher = MicroBatcher(predict, max_batch=max_batch, max_wait=max_wait_ms / 1e3)
+    return server
+
+
+class PolicyClient:
+    """Cliente do servidor; predict tem a assinatura do model.predict do SB3."""
+
+    def __init__(self, address=DEFAULT_ADDRESS):
+        address = parse_address(address)
+        family = socket.AF_INET if isinstance(address, tuple) else socket.AF_UNIX
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        self.sock.connect(address)
+        if family == socket.AF_INET:
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        (length,) = _HEADER.unpack(recv_exact(self.sock, _HEADER.size))
+        handshake = json.loads(recv_exact(self.sock, length))
+        self.observation_shape = tuple(handshake["observation_shape"])
+        self.action_dim = handshake["action_dim"]
+
+    def predict(self, obs, state=None, episode_start=None, deterministic=True):
+        obs = np.ascontiguousarray(obs, dtype=np.uint8).reshape(-1, *self.observation_shape)
+        self.sock.sendall(_HEADER.pack(len(obs)) + obs.tobytes())
+        data = recv_exact(self.sock, len(obs) * self.action_dim * 4)
+        return np.frombuffer(data, dtype=np.float32).reshape(len(obs), self.action_dim), None
+
+    def close(self):
+        self.sock.close()
+
+
+def _load_test_client(address, n_steps, seed):
+    # Um carro simulado com a mesma pilha de wrappers do treinamento (CustomCarRacingWrapper incluso)
+    from stable_baselines3.common.vec_env import VecFrameStack
+
+    from car_racing_env import make_training_vec_env
+    from config import N_STACK
+
+    vec_env = VecFrameStack(make_training_vec_env(n_envs=1, backend="dummy", seed=seed, track_cache=None),
+                            n_stack=N_STACK)
+    client = PolicyClient(address)
+    latencies = []
+    obs = vec_env.reset()
+    for _ in range(n_steps):
+        start = time.perf_counter()
+        actions, _ = client.predict(obs)
+        latencies.append(time.perf_counter() - start)
+        obs, _, _, _ = vec_env.step(actions)
+    client.close()
+    vec_env.close()
+    return latencies
+
+
+def run_load_test(address=DEFAULT_ADDRESS, n_clients=8, n_steps=500):
+    """Roda `n_clients` ambientes em processos separados contra o servidor."""
+    from concurrent.futures import ProcessPoolExecutor
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=n_clients) as executor:
+        futures = [executor.submit(_load_test_client, address, n_steps, seed) for seed in range(n_clients)]
+        latencies = np.concatenate([future.result() for future in futures]) * 1e3
+    wall_time = time.perf_counter() - start
+    p50, p99 = np.percentile(latencies, [50, 99])
+    return {
+        "clients": n_clients,
+        "steps": len(latencies),
+        "steps_per_s": len(latencies) / wall_time,
+        "latency_p50_ms": float(p50),
+        "latency_p99_ms": float(p99),
+    }
+
+
+def _print_metrics(prefix, metrics):
+    print(prefix + " | ".join(f"{name}={value:.2f}" if isinstance(value, float) else f"{name}={value}"
+                              for name, value in metrics.items()), flush=True)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Servidor local de política com micro-batching e teste de carga.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve = subparsers.add_parser("serve", help="Carrega o checkpoint e atende clientes")
+    serve.add_argument("model_path", help="Arquivo .zip do treinamento ou .pt do inference.py")
+    serve.add_argument("--address", default=DEFAULT_ADDRESS, help="Caminho de socket Unix ou host:porta")
+    serve.add_argument("--allow-remote", action="store_true",
+                       help="Aceita host TCP fora de localhost (sem autenticação: só em rede confiável)")
+    serve.add_argument("--max-batch", type=int, default=DEFAULT_MAX_BATCH)
+    serve.add_argument("--max-wait-ms", type=float, default=DEFAULT_MAX_WAIT_MS)
+    serve.add_argument("--report-every", type=float, default=10.0, help="Intervalo (s) entre relatórios de métricas")
+    load_test = subparsers.add_parser("load-test", help="Dirige vários ambientes contra um servidor já rodando")
+    load_test.add_argument("--address", default=DEFAULT_ADDRESS)
+    load_test.add_argument("--clients", type=int, default=8)
+    load_test.add_argument("--steps", type=int, default=500)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        server = make_server(args.model_path, args.address, args.max_batch, args.max_wait_ms,
+                             allow_remote=args.allow_remote)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print(f"Servindo {args.model_path} em {args.address} (max_batch={args.max_batch}, "
+              f"max_wait={args.max_wait_ms} ms)", flush=True)
+        try:
+            while True:
+                time.sleep(args.report_every)
+                _print_metrics("[servidor] ", server.batcher.metrics.summary())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.shutdown()
+            server.server_close()
+            server.batcher.close()
+            _print_metrics("[servidor] final: ", server.batcher.metrics.summary())
+    else:
+        _print_metrics("[carga] ", run_load_test(args.address, args.clients, args.steps))
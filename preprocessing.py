@@ -0,0 +1,130 @@
+import numpy as np
+from gymnasium import spaces
+from stable_baselines3.common.vec_env import VecEnvWrapper
+
+from config import DEFAULT_PREPROCESSING # Recorte do HUD, cinza e tamanho padrão (config.py)
+from grass_detection import HUD_ROWS
+
+# Pesos de luminância (ITU-R BT.601) em ponto fixo: soma 256, resultado >> 8.
+# A paleta cinza da renderização nativa usa a mesma conversão.
+GRAY_WEIGHTS = np.array([77, 150, 29], dtype=np.uint16)
+
+
+def rgb_to_gray(rgb):
+    """Luminância uint8 de pixels RGB uint8 (canais no último eixo, que é removido)."""
+    return ((rgb @ GRAY_WEIGHTS) >> 8).astype(np.uint8)
+
+
+class VecObservationPreprocessor(VecEnvWrapper):
+    """
+    Recorte, escala de cinza e redimensionamento das observações de todo o lote
+    de ambientes, sempre em uint8. Deve ficar abaixo do VecFrameStack (e acima
+    do VecGrassDetector, que precisa dos frames RGB originais).
+
+    O redimensionamento é por vizinho mais próximo, com índices pré-calculados:
+    recorte e redução viram uma única indexação do lote.
+    """
+
+    def __init__(self, venv, crop_hud=True, grayscale=True, size=64):
+        height, width, channels = venv.observation_space.shape
+        top_height = height - HUD_ROWS if crop_hud else height
+        out_height, out_width = (size, size) if size else (top_height, width)
+        out_channels = 1 if grayscale else channels
+
+        # Centro de cada pixel de saída mapeado para o pixel de entrada mais próximo
+        self._rows = ((np.arange(out_height) + 0.5) * top_height / out_height).astype(np.intp)
+        self._cols = ((np.arange(out_width) + 0.5) * width / out_width).astype(np.intp)
+        self.grayscale = grayscale
+
+        observation_space = spaces.Box(low=0, high=255, shape=(out_height, out_width, out_channels), dtype=np.uint8)
+        super().__init__(venv, observation_space=observation_space)
+
+    def _process(self, obs):
+        # obs: (n_envs, H, W, 3) ou (H, W, 3) para observações terminais
+        resized = obs[..., self._rows[:, np.newaxis], self._cols, :]
+        if not self.grayscale:
+            return resized
+        return rgb_to_gray(resized)[..., np.newaxis]
+
+    def reset(self):
+        return self._process(self.venv.reset())
+
+    def step_wait(self):
+        obs, rewards, dones, infos = self.venv.step_wait()
+        for env_idx in np.flatnonzero(dones):
+            # O bootstrap do PPO em episódios truncados usa a observação terminal
+            terminal_obs = infos[env_idx].get("terminal_observation")
+            if terminal_obs is not None:
+                infos[env_idx]["terminal_observation"] = self._process(terminal_obs)
+        return self._process(obs), rewards, dones, infos
+
+
+def apply_preprocessing(vec_env, preprocessing):
+    # preprocessing=None mantém as observações RGB 96x96 originais
+    if preprocessing is None:
+        return vec_env
+    return VecObservationPreprocessor(vec_env, **preprocessing)
+
+
+def rollout_observation_nbytes(obs_shape, n_steps, n_envs, n_stack=4, dtype=np.uint8):
+    height, width, channels = obs_shape
+    return n_steps * n_envs * height * width * channels * n_stack * np.dtype(dtype).itemsize
+
+
+def time_policy_update(observation_space, action_space, batch_size=64, n_iters=20):
+    """
+    Tempo médio (s) de forward + backward da CnnPolicy num minibatch.
+    `observation_space` pode vir com os canais por último, como sai dos
+    ambientes: a política recebe a versão transposta, como no PPO.
+    """
+    import time
+
+    import torch
+    from stable_baselines3.common.policies import ActorCriticCnnPolicy
+    from stable_baselines3.common.preprocessing import is_image_space_channels_first
+    from stable_baselines3.common.vec_env import VecTransposeImage
+
+    if not is_image_space_channels_first(observation_space):
+        observation_space = VecTransposeImage.transpose_space(observation_space)
+    policy = ActorCriticCnnPolicy(observation_space, action_space, lr_schedule=lambda _: 3e-4)
+    obs = torch.as_tensor(np.stack([observation_space.sample() for _ in range(batch_size)]))
+    actions = torch.as_tensor(np.stack([action_space.sample() for _ in range(batch_size)]))
+    for i in range(n_iters + 1):
+        if i == 1:
+            # A primeira iteração é aquecimento
+            start = time.perf_counter()
+        values, log_prob, entropy = policy.evaluate_actions(obs, actions)
+        loss = values.mean() + log_prob.mean() + entropy.mean()
+        policy.optimizer.zero_grad()
+        loss.backward()
+        policy.optimizer.step()
+    return (time.perf_counter() - start) / n_iters
+
+
+if __name__ == "__main__":
+    from car_racing_env import car_racing_action_space
+
+    # --- Relatório: memória do rollout e custo da CnnPolicy, antes e depois ---
+    N_STEPS, N_ENVS, N_STACK = 2048, 4, 4
+    action_space = car_racing_action_space()
+
+    raw_shape = (96, 96, 3)
+    size = DEFAULT_PREPROCESSING["size"]
+    processed_shape = (size, size, 1 if DEFAULT_PREPROCESSING["grayscale"] else 3)
+
+    raw_float = rollout_observation_nbytes(raw_shape, N_STEPS, N_ENVS, N_STACK, dtype=np.float32)
+    raw_uint8 = rollout_observation_nbytes(raw_shape, N_STEPS, N_ENVS, N_STACK)
+    processed_uint8 = rollout_observation_nbytes(processed_shape, N_STEPS, N_ENVS, N_STACK)
+    print(f"Observações do rollout (n_steps={N_STEPS}, n_envs={N_ENVS}, n_stack={N_STACK}):")
+    print(f"  RGB 96x96 float32 (RolloutBuffer padrão): {raw_float / 2**20:8.1f} MiB")
+    print(f"  RGB 96x96 uint8:                          {raw_uint8 / 2**20:8.1f} MiB")
+    print(f"  {processed_shape} uint8:                  {processed_uint8 / 2**20:8.1f} MiB "
+          f"({raw_float / processed_uint8:.1f}x menor)")
+
+    raw_space = spaces.Box(0, 255, shape=raw_shape[:2] + (raw_shape[2] * N_STACK,), dtype=np.uint8)
+    processed_space = spaces.Box(0, 255, shape=processed_shape[:2] + (processed_shape[2] * N_STACK,), dtype=np.uint8)
+    raw_time = time_policy_update(raw_space, action_space)
+    processed_time = time_policy_update(processed_space, action_space)
+    print("CnnPolicy forward + backward (batch_size=64):")
+    print(f"  {raw_space.shape}: {raw_time * 1e3:.2f} ms")
+    print(f"  {processed_space.shape}: {processed_time * 1e3:.2f} ms ({raw_time / processed_time:.2f}x mais rápido)")
@@ -0,0 +1,128 @@
+import os
+import time
+
+import numpy as np
+from stable_baselines3.common.vec_env import VecEnvWrapper
+
+# --- Divisão de núcleos entre o learner e os workers dos ambientes ---
+# Sem configuração, o pool de threads do torch (atualizações e inferência da
+# CnnPolicy) e os processos do CarRacing disputam todos os núcleos. Aqui os
+# núcleos disponíveis são divididos em dois conjuntos: o processo principal
+# fica preso aos núcleos do learner, com o torch usando exatamente esse
+# número de threads, e cada worker de ambiente fica preso a um núcleo do
+# outro conjunto, com BLAS/OpenMP em uma thread. Afinidade de CPU só existe
+# no Linux (os.sched_setaffinity): no Windows e no macOS nada é preso.
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMEXPR_NUM_THREADS")
+
+
+def affinity_supported():
+    return hasattr(os, "sched_setaffinity")
+
+
+def available_cores():
+    return sorted(os.sched_getaffinity(0))
+
+
+def limit_worker_threads(n_threads=1):
+    """
+    Deve ser chamada antes de criar os VecEnvs: os workers herdam estas
+    variáveis e as bibliotecas numéricas as leem ao serem importadas.
+    """
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(n_threads)
+
+
+def plan_cores(learner_cores=None, cores=None):
+    """
+    Divide `cores` (padrão: os núcleos disponíveis para este processo) em
+    {"learner": [...], "envs": [...]}. Sem `learner_cores`, o learner fica
+    com um quarto dos núcleos (pelo menos um).
+    """
+    cores = list(cores or available_cores())
+    if len(cores) == 1:
+        return {"learner": cores, "envs": cores}
+    if learner_cores is None:
+        learner_cores = max(1, len(cores) // 4)
+    learner_cores = min(max(1, learner_cores), len(cores) - 1)
+    return {"learner": cores[:learner_cores], "envs": cores[learner_cores:]}
+
+
+def worker_processes(vec_env):
+    # Processos dos VecEnvs multiprocesso, inclusive dentro de cada grupo de um GroupedVecEnv
+    processes = []
+    for venv in getattr(vec_env, "groups", [vec_env]):
+        while isinstance(venv, VecEnvWrapper):
+            venv = venv.venv
+        processes.extend(getattr(venv, "processes", []))
+    return processes
+
+
+def pin_workers(vec_env, env_cores):
+    # Um worker por núcleo, em rodízio quando há mais workers que núcleos
+    for i, process in enumerate(worker_processes(vec_env)):
+        os.sched_setaffinity(process.pid, {env_cores[i % len(env_cores)]})
+
+
+def apply_plan(plan, vec_env):
+    import torch
+
+    pin_workers(vec_env, plan["envs"])
+    os.sched_setaffinity(0, set(plan["learner"]))
+    torch.set_num_threads(len(plan["learner"]))
+
+
+def _env_steps_per_second(vec_env, n_steps):
+    actions = np.stack([vec_env.action_space.sample() for _ in range(vec_env.num_envs)])
+    vec_env.reset()
+    vec_env.step(actions) # aquecimento
+    start = time.perf_counter()
+    for _ in range(n_steps):
+        vec_env.step(actions)
+    return n_steps * vec_env.num_envs / (time.perf_counter() - start)
+
+
+def calibrate_plan(make_vec_env, model, n_env_steps=50, n_learner_iters=5, verbose=True):
+    """
+    Mede, para cada divisão candidata, a vazão dos ambientes presos aos seus
+    núcleos e o custo do learner com o número de threads correspondente, e
+    devolve o plano com mais passos/s estimados. Coleta e atualização do PPO
+    se alternam, então o tempo por passo é a soma das duas partes.
+
+    Os passos de calibração rodam num VecEnv descartável criado por
+    `make_vec_env` (mesmo número de workers do treino), não nos ambientes do
+    treino: nada passa pelo Monitor nem pelo gravador de trajetórias. O
+    learner é medido com o time_policy_update do preprocessing.py (n_epochs
+    passadas de gradiente por amostra); a inferência da coleta, uma única
+    passada sem gradiente, fica de fora.
+    """
+    import torch
+
+    from preprocessing import time_policy_update
+
+    cores = available_cores()
+    candidates = sorted({min(2 ** i, len(cores) - 1) for i in range(len(cores).bit_length())} - {0}) or [1]
+    best_plan, best_rate = None, 0.0
+    vec_env = make_vec_env()
+    try:
+        for learner_cores in candidates:
+            plan = plan_cores(learner_cores, cores)
+            pin_workers(vec_env, plan["envs"])
+            # O processo principal só participa da simulação através dos workers;
+            # para o learner, basta limitar as threads do torch
+            os.sched_setaffinity(0, set(plan["learner"]))
+            torch.set_num_threads(len(plan["learner"]))
+            env_rate = _env_steps_per_second(vec_env, n_env_steps)
+            update_time = time_policy_update(model.observation_space, model.action_space,
+                                             batch_size=model.batch_size, n_iters=n_learner_iters)
+            learner_time = model.n_epochs * update_time / model.batch_size
+            rate = 1.0 / (1.0 / env_rate + learner_time)
+            if verbose:
+                print(f"[calibração] learner {len(plan['learner'])} núcleos / ambientes {len(plan['envs'])}: "
+                      f"ambientes {env_rate:.0f} passos/s, learner {learner_time * 1e3:.3f} ms/passo "
+                      f"-> {rate:.0f} passos/s estimados", flush=True)
+            if rate > best_rate:
+                best_plan, best_rate = plan, rate
+    finally:
+        vec_env.close()
+        os.sched_setaffinity(0, set(cores))
+    return best_plan
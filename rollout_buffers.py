@@ -0,0 +1,164 @@
+import numpy as np
+from stable_baselines3.common.buffers import RolloutBuffer
+from stable_baselines3.common.preprocessing import is_image_space_channels_first
+
+
+class Uint8RolloutBuffer(RolloutBuffer):
+    """
+    RolloutBuffer que guarda as observações no dtype do espaço de observação
+    (uint8 para imagens) em vez de float32. A normalização para [0, 1] já é
+    feita pela política (preprocess_obs), então o treino não muda, mas as
+    observações ocupam 4x menos memória.
+    """
+
+    def reset(self):
+        obs_dtype = self.observation_space.dtype
+        self.observations = np.zeros((self.buffer_size, self.n_envs, *self.obs_shape), dtype=obs_dtype)
+        self.actions = np.zeros((self.buffer_size, self.n_envs, self.action_dim), dtype=np.float32)
+        self.rewards = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
+        self.returns = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
+        self.episode_starts = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
+        self.values = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
+        self.log_probs = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
+        self.advantages = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
+        self.generator_ready = False
+        # Pula o reset do RolloutBuffer (que realocaria tudo em float32)
+        super(RolloutBuffer, self).reset()
+
+
+class LazyStackedObservations:
+    """
+    Observações empilhadas montadas sob demanda a partir de um frame por passo.
+
+    Indexada como o array achatado do RolloutBuffer (índice = env * buffer_size + passo),
+    devolve o mesmo conteúdo que o VecFrameStack produziu: frames de antes do
+    início do episódio viram zeros e, no começo do rollout, os frames anteriores
+    vêm do prefixo guardado no primeiro add().
+    """
+
+    def __init__(self, frames, initial_frames, episode_starts, n_stack, channels_first):
+        self.frames = frames
+        self.initial_frames = initial_frames
+        self.n_stack = n_stack
+        self.channels_first = channels_first
+        buffer_size, n_envs, *frame_shape = frames.shape
+        self.channels = frame_shape[0] if channels_first else frame_shape[-1]
+        stack_axis = 0 if channels_first else -1
+        frame_shape[stack_axis] *= n_stack
+        self.buffer_size = buffer_size
+        self.shape = (buffer_size * n_envs, *frame_shape)
+        # Índice do início de episódio mais recente em cada passo (-1 se nenhum no rollout)
+        steps = np.arange(buffer_size)[:, np.newaxis]
+        marks = np.where(episode_starts > 0, steps, -1)
+        self._episode_start_idx = np.maximum.accumulate(marks, axis=0)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, batch_inds):
+        steps, envs = batch_inds % self.buffer_size, batch_inds // self.buffer_size
+        starts = self._episode_start_idx[steps, envs]
+        out = np.zeros((len(batch_inds), *self.shape[1:]), dtype=self.frames.dtype)
+        for k in range(self.n_stack):
+            src = steps - (self.n_stack - 1 - k)
+            channel_slice = slice(k * self.channels, (k + 1) * self.channels)
+            from_frames = src >= np.maximum(starts, 0)
+            out[self._index(from_frames, channel_slice)] = self.frames[src[from_frames], envs[from_frames]]
+            from_prefix = (src < 0) & (starts < 0)
+            if from_prefix.any():
+                prefix_idx = src[from_prefix] + self.n_stack - 1
+                out[self._index(from_prefix, channel_slice)] = self.initial_frames[envs[from_prefix], prefix_idx]
+        return out
+
+    def _index(self, rows, channel_slice):
+        return (rows, channel_slice) if self.channels_first else (rows, Ellipsis, channel_slice)
+
+
+class FrameDedupRolloutBuffer(Uint8RolloutBuffer):
+    """
+    RolloutBuffer para observações vindas do VecFrameStack que guarda cada frame
+    uma única vez (anel por ambiente de buffer_size passos) em vez das n_stack
+    cópias presentes nas observações empilhadas. As pilhas só são montadas ao
+    amostrar cada minibatch, o que corta a memória de observações em ~n_stack vezes.
+
+    Aceita observações channels-last (H, W, C * n_stack), como as do VecFrameStack,
+    e channels-first (C * n_stack, H, W), como as que chegam ao buffer depois do
+    VecTransposeImage que o SB3 coloca automaticamente em imagens HWC.
+    """
+
+    def __init__(self, *args, n_stack=4, **kwargs):
+        self.n_stack = n_stack
+        super().__init__(*args, **kwargs)
+
+    def reset(self):
+        self.channels_first = is_image_space_channels_first(self.observation_space)
+        stack_axis = 0 if self.channels_first else -1
+        frame_shape = list(self.obs_shape)
+        if frame_shape[stack_axis] % self.n_stack:
+            raise ValueError(f"Observação {self.obs_shape} não é compatível com n_stack={self.n_stack}")
+        frame_shape[stack_axis] //= self.n_stack
+        self.channels = frame_shape[stack_axis]
+        obs_dtype = self.observation_space.dtype
+        self.frames = np.zeros((self.buffer_size, self.n_envs, *frame_shape), dtype=obs_dtype)
+        self.initial_frames = np.zeros((self.n_envs, self.n_stack - 1, *frame_shape), dtype=obs_dtype)
+        self.observations = None
+        self.actions = np.zeros((self.buffer_size, self.n_envs, self.action_dim), dtype=np.float32)
+        self.rewards = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
+        self.returns = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
+        self.episode_starts = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
+        self.values = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
+        self.log_probs = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
+        self.advantages = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
+        self.generator_ready = False
+        super(RolloutBuffer, self).reset()
+
+    def add(self, obs, action, reward, episode_start, value, log_prob):
+        if len(log_prob.shape) == 0:
+            log_prob = log_prob.reshape(-1, 1)
+        action = action.reshape((self.n_envs, self.action_dim))
+
+        channels = self.channels
+        if self.pos == 0:
+            # Frames anteriores ao rollout, necessários para montar as primeiras pilhas
+            if self.channels_first:
+                history = obs[:, :-channels].reshape(self.n_envs, self.n_stack - 1, *self.frames.shape[2:])
+            else:
+                height, width = self.obs_shape[:2]
+                history = obs[..., :-channels].reshape(self.n_envs, height, width, self.n_stack - 1, channels)
+                history = history.transpose(0, 3, 1, 2, 4)
+            self.initial_frames[:] = history
+        # Só o frame mais novo (últimos canais) é guardado
+        self.frames[self.pos] = obs[:, -channels:] if self.channels_first else obs[..., -channels:]
+
+        self.actions[self.pos] = np.array(action)
+        self.rewards[self.pos] = np.array(reward)
+        self.episode_starts[self.pos] = np.array(episode_start)
+        self.values[self.pos] = value.clone().cpu().numpy().flatten()
+        self.log_probs[self.pos] = log_prob.clone().cpu().numpy()
+        self.pos += 1
+        if self.pos == self.buffer_size:
+            self.full = True
+
+    def get(self, batch_size=None):
+        assert self.full, ""
+        indices = np.random.permutation(self.buffer_size * self.n_envs)
+        if not self.generator_ready:
+            self.observations = LazyStackedObservations(self.frames, self.initial_frames, self.episode_starts,
+                                                        self.n_stack, self.channels_first)
+            for tensor in ["actions", "values", "log_probs", "advantages", "returns"]:
+                self.__dict__[tensor] = self.swap_and_flatten(self.__dict__[tensor])
+            self.generator_ready = True
+
+        if batch_size is None:
+            batch_size = self.buffer_size * self.n_envs
+
+        start_idx = 0
+        while start_idx < self.buffer_size * self.n_envs:
+            yield self._get_samples(indices[start_idx : start_idx + batch_size])
+            start_idx += batch_size
+
+
+def rollout_buffer_nbytes(buffer):
+    arrays = ("observations", "frames", "initial_frames", "actions", "rewards", "returns", "episode_starts",
+              "values", "log_probs", "advantages")
+    return sum(getattr(buffer, name).nbytes for name in arrays if isinstance(getattr(buffer, name, None), np.ndarray))
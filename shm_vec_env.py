@@ -0,0 +1,234 @@
+import multiprocessing as mp
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+from gymnasium import spaces
+from stable_baselines3.common.env_util import make_vec_env
+from stable_baselines3.common.vec_env import DummyVecEnv, SubprocVecEnv
+from stable_baselines3.common.vec_env.base_vec_env import CloudpickleWrapper
+from stable_baselines3.common.vec_env.patch_gym import _patch_env
+
+# --- Backend vetorizado multiprocesso com observações em memória compartilhada ---
+# Cada worker roda um ambiente CarRacing e escreve o frame (96x96x3 uint8)
+# direto num bloco de memória compartilhada. O processo principal lê as
+# observações sem cópia: só recompensas, dones e infos passam pelos pipes.
+#
+# O bloco tem dois "slots" por ambiente (buffer duplo): o array devolvido por
+# step()/reset() continua válido até a chamada seguinte. Isso é necessário
+# porque o PPO guarda `_last_obs` e só o copia para o rollout buffer depois
+# do próximo env.step().
+N_OBS_SLOTS = 2
+
+
+def _shm_worker(remote, parent_remote, env_fn_wrapper, env_idx):
+    from stable_baselines3.common.env_util import is_wrapped
+
+    parent_remote.close()
+    env = _patch_env(env_fn_wrapper.var())
+    # O processo principal dimensiona o bloco com os espaços informados aqui
+    # e responde com o nome dele
+    remote.send((env.observation_space, env.action_space))
+    shm_name, obs_shape, obs_dtype = remote.recv()
+    shm = shared_memory.SharedMemory(name=shm_name)
+    obs_buf = np.ndarray((N_OBS_SLOTS, *obs_shape), dtype=obs_dtype, buffer=shm.buf)
+    reset_info = {}
+    try:
+        while True:
+            try:
+                cmd, data = remote.recv()
+                if cmd == "step":
+                    action, slot = data
+                    observation, reward, terminated, truncated, info = env.step(action)
+                    done = terminated or truncated
+                    info["TimeLimit.truncated"] = truncated and not terminated
+                    if done:
+                        # A observação terminal é rara: vai pelo pipe junto com o info
+                        info["terminal_observation"] = observation
+                        observation, reset_info = env.reset()
+                    obs_buf[slot, env_idx] = observation
+                    remote.send((reward, done, info, reset_info))
+                elif cmd == "reset":
+                    seed, options, slot = data
+                    maybe_options = {"options": options} if options else {}
+                    observation, reset_info = env.reset(seed=seed, **maybe_options)
+                    obs_buf[slot, env_idx] = observation
+                    remote.send(reset_info)
+                elif cmd == "render":
+                    remote.send(env.render())
+                elif cmd == "close":
+                    env.close()
+                    remote.close()
+                    break
+                elif cmd == "get_spaces":
+                    remote.send((env.observation_space, env.action_space))
+                elif cmd == "env_method":
+                    method = env.get_wrapper_attr(data[0])
+                    remote.send(method(*data[1], **data[2]))
+                elif cmd == "get_attr":
+                    remote.send(env.get_wrapper_attr(data))
+                elif cmd == "has_attr":
+                    try:
+                        env.get_wrapper_attr(data)
+                        remote.send(True)
+                    except AttributeError:
+                        remote.send(False)
+                elif cmd == "set_attr":
+                    remote.send(setattr(env, data[0], data[1]))
+                elif cmd == "is_wrapped":
+                    remote.send(is_wrapped(env, data))
+                else:
+                    raise NotImplementedError(f"`{cmd}` não é implementado no worker")
+            except EOFError:
+                break
+            except KeyboardInterrupt:
+                break
+    finally:
+        del obs_buf
+        shm.close()
+
+
+class SharedMemoryVecEnv(SubprocVecEnv):
+    """
+    Variante do SubprocVecEnv em que as observações são escritas pelos workers
+    num bloco de memória compartilhada em vez de serializadas pelos pipes.
+
+    Só suporta espaços de observação `Box` (o caso do CarRacing).
+    """
+
+    def __init__(self, env_fns, start_method=None):
+        self.waiting = False
+        self.closed = False
+        n_envs = len(env_fns)
+        if n_envs < 1:
+            raise ValueError("SharedMemoryVecEnv precisa de pelo menos um ambiente")
+
+        if start_method is None:
+            # Mesmo padrão do SubprocVecEnv: forkserver é seguro com threads do torch
+            forkserver_available = "forkserver" in mp.get_all_start_methods()
+            start_method = "forkserver" if forkserver_available else "spawn"
+        ctx = mp.get_context(start_method)
+
+        self.remotes, self.work_remotes = zip(*[ctx.Pipe() for _ in range(n_envs)])
+        self.processes = []
+        for env_idx, (work_remote, remote, env_fn) in enumerate(zip(self.work_remotes, self.remotes, env_fns)):
+            args = (work_remote, remote, CloudpickleWrapper(env_fn), env_idx)
+            process = ctx.Process(target=_shm_worker, args=args, daemon=True)
+            process.start()
+            self.processes.append(process)
+            work_remote.close()
+
+        # Os espaços vêm dos ambientes já criados nos workers: nenhuma
+        # instância extra do CarRacing é montada no processo principal
+        observation_space, action_space = [remote.recv() for remote in self.remotes][0]
+        if not isinstance(observation_space, spaces.Box):
+            for process in self.processes:
+                process.terminate()
+            raise ValueError(f"SharedMemoryVecEnv só suporta observações Box, recebido: {observation_space}")
+
+        obs_shape = (n_envs, *observation_space.shape)
+        obs_dtype = observation_space.dtype
+        nbytes = N_OBS_SLOTS * int(np.prod(obs_shape)) * np.dtype(obs_dtype).itemsize
+        self._shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        self._obs_buf = np.ndarray((N_OBS_SLOTS, *obs_shape), dtype=obs_dtype, buffer=self._shm.buf)
+        self._slot = 0
+        for remote in self.remotes:
+            remote.send((self._shm.name, obs_shape, obs_dtype))
+
+        super(SubprocVecEnv, self).__init__(n_envs, observation_space, action_space)
+
+    def step_async(self, actions):
+        self._slot = (self._slot + 1) % N_OBS_SLOTS
+        for remote, action in zip(self.remotes, actions):
+            remote.send(("step", (action, self._slot)))
+        self.waiting = True
+
+    def step_wait(self):
+        results = [remote.recv() for remote in self.remotes]
+        self.waiting = False
+        rews, dones, infos, self.reset_infos = zip(*results)
+        # Visão direta do bloco compartilhado (sem cópia)
+        return self._obs_buf[self._slot], np.stack(rews), np.stack(dones), infos
+
+    def reset(self):
+        self._slot = (self._slot + 1) % N_OBS_SLOTS
+        for env_idx, remote in enumerate(self.remotes):
+            remote.send(("reset", (self._seeds[env_idx], self._options[env_idx], self._slot)))
+        self.reset_infos = [remote.recv() for remote in self.remotes]
+        self._reset_seeds()
+        self._reset_options()
+        return self._obs_buf[self._slot]
+
+    def close(self):
+        if self.closed:
+            return
+        super().close()
+        del self._obs_buf
+        self._shm.close()
+        self._shm.unlink()
+
+
+# --- Backends disponíveis ---
+# "dummy": serial, todos os ambientes no processo principal (comportamento antigo)
+# "subproc": SubprocVecEnv padrão do SB3 (observações serializadas nos pipes)
+# "shm": SharedMemoryVecEnv (observações em memória compartilhada)
+VEC_ENV_BACKENDS = {
+    "dummy": DummyVecEnv,
+    "subproc": SubprocVecEnv,
+    "shm": SharedMemoryVecEnv,
+}
+
+
+def make_backend_vec_env(env_fn, n_envs, backend="shm", seed=0, monitor=True, **kwargs):
+    if backend not in VEC_ENV_BACKENDS:
+        raise ValueError(f"Backend desconhecido: {backend}. Opções: {list(VEC_ENV_BACKENDS)}")
+    vec_env_cls = VEC_ENV_BACKENDS[backend]
+    if monitor:
+        return make_vec_env(env_fn, n_envs=n_envs, seed=seed, vec_env_cls=vec_env_cls, **kwargs)
+
+    # Sem Monitor por ambiente: usado quando um estágio no nível do VecEnv pode
+    # encerrar episódios (o VecMonitor deve então ficar acima desse estágio).
+    vec_env = vec_env_cls([env_fn] * n_envs, **kwargs.get("vec_env_kwargs", {}))
+    vec_env.seed(seed)
+    return vec_env
+
+
+def benchmark_backend(env_fn, n_envs, backend, n_steps=500, seed=0):
+    """Mede passos de ambiente por segundo (somando todos os envs) com ações aleatórias."""
+    vec_env = make_backend_vec_env(env_fn, n_envs, backend=backend, seed=seed)
+    try:
+        vec_env.action_space.seed(seed)
+        vec_env.reset()
+        actions = np.stack([vec_env.action_space.sample() for _ in range(n_envs)])
+        start = time.perf_counter()
+        for _ in range(n_steps):
+            vec_env.step(actions)
+        elapsed = time.perf_counter() - start
+    finally:
+        vec_env.close()
+    return n_envs * n_steps / elapsed
+
+
+def compare_backends(env_fn, n_envs, backends=("dummy", "subproc", "shm"), n_steps=500):
+    results = {backend: benchmark_backend(env_fn, n_envs, backend, n_steps=n_steps) for backend in backends}
+    baseline = results.get("dummy")
+    for backend, steps_per_sec in results.items():
+        speedup = f" ({steps_per_sec / baseline:.2f}x vs serial)" if baseline else ""
+        print(f"{backend:>8}: {steps_per_sec:9.1f} passos/s{speedup}")
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+
+    from car_racing_env import make_env_with_wrappers
+
+    parser = argparse.ArgumentParser(description="Compara a vazão dos backends de VecEnv no CarRacing.")
+    parser.add_argument("--n-envs", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--n-steps", type=int, default=500)
+    parser.add_argument("--backends", nargs="+", default=["dummy", "subproc", "shm"], choices=list(VEC_ENV_BACKENDS))
+    args = parser.parse_args()
+
+    print(f"Benchmark com {args.n_envs} ambientes x {args.n_steps} passos")
+    compare_backends(make_env_with_wrappers, args.n_envs, backends=args.backends, n_steps=args.n_steps)
@@ -0,0 +1,226 @@
+import json
+import math
+import multiprocessing as mp
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+from checkpoint_files import save_json_atomic
+
+# --- Busca de hiperparâmetros com successive halving assíncrono (ASHA) ---
+# Cada trial é uma configuração sorteada do SEARCH_SPACE. Um trabalho treina
+# um trial até o orçamento de um degrau (rung) e o avalia sem janela; só o
+# melhor 1/eta dos trials que completaram um degrau sobe para o próximo, com
+# eta vezes mais passos. Os demais param ali, sem ocupar mais núcleos. Os
+# trabalhos rodam em paralelo dentro de um orçamento fixo de núcleos, e o
+# estado (trials, configurações, notas por degrau) vai para sweep.json a
+# cada resultado: rodar de novo com o mesmo diretório retoma a busca.
+SWEEPS_DIR = "./sweeps/"
+STATE_FILENAME = "sweep.json"
+LEADERBOARD_FILENAME = "leaderboard.json"
+
+# ("log_uniform", mínimo, máximo) ou ("choice", [valores])
+SEARCH_SPACE = {
+    "learning_rate": ("log_uniform", 1e-4, 1e-3),
+    "n_steps": ("choice", [512, 1024, 2048]),
+    "batch_size": ("choice", [64, 128, 256]),
+    "n_epochs": ("choice", [4, 10]),
+    "ent_coef": ("log_uniform", 1e-4, 0.05),
+    "clip_range": ("choice", [0.1, 0.2, 0.3]),
+    "grass_pixel_threshold": ("choice", [250, 500, 1000]),
+    "off_track_penalty": ("choice", [-100, -500, -1000]),
+}
+PPO_PARAMS = ("learning_rate", "n_steps", "batch_size", "n_epochs", "ent_coef", "clip_range")
+
+
+def sample_config(rng, search_space=SEARCH_SPACE):
+    config = {}
+    for name, (kind, *args) in search_space.items():
+        if kind == "log_uniform":
+            low, high = args
+            config[name] = float(math.exp(rng.uniform(math.log(low), math.log(high))))
+        elif kind == "choice":
+            config[name] = args[0][int(rng.integers(len(args[0])))]
+        else:
+            raise ValueError(f"Tipo de parâmetro desconhecido: {kind}")
+    return config
+
+
+def rung_budgets(min_timesteps, max_timesteps, eta):
+    budgets = [min_timesteps]
+    while budgets[-1] * eta <= max_timesteps:
+        budgets.append(budgets[-1] * eta)
+    return budgets
+
+
+def run_trial_rung(trial_dir, config, budget, n_envs, eval_episodes, seed):
+    """
+    Treina o trial até `budget` passos (continuando do .zip do degrau
+    anterior, se houver) e devolve a nota da avaliação headless.
+    """
+    import torch
+    from stable_baselines3 import PPO
+    from stable_baselines3.common.vec_env import VecFrameStack
+
+    from car_racing_env import make_training_vec_env, rollout_buffer_config
+    from config import N_STACK, PPO_HYPERPARAMS
+    from evaluate import EVAL_SEED, evaluate_model, summarize
+
+    torch.set_num_threads(1) # Os demais núcleos do trial ficam com os workers dos ambientes
+    vec_env = make_training_vec_env(n_envs=n_envs, backend="subproc", seed=seed,
+                                    grass_threshold=config["grass_pixel_threshold"],
+                                    off_track_penalty=config["off_track_penalty"])
+    vec_env = VecFrameStack(vec_env, n_stack=N_STACK)
+    model_path = os.path.join(trial_dir, "model.zip")
+    if os.path.exists(model_path):
+        model = PPO.load(model_path, env=vec_env, device="cpu")
+    else:
+        rollout_buffer_class, rollout_buffer_kwargs = rollout_buffer_config()
+        hyperparams = {**PPO_HYPERPARAMS, **{name: config[name] for name in PPO_PARAMS}}
+        model = PPO("CnnPolicy", vec_env, device="cpu", seed=seed, rollout_buffer_class=rollout_buffer_class,
+                    rollout_buffer_kwargs=rollout_buffer_kwargs, **hyperparams)
+    try:
+        if budget > model.num_timesteps:
+            model.learn(total_timesteps=budget - model.num_timesteps, reset_num_timesteps=False)
+    finally:
+        vec_env.close()
+    # Grava com outro nome e renomeia: um trabalho interrompido deixa o .zip do degrau anterior intacto
+    tmp_path = os.path.join(trial_dir, "model.tmp.zip")
+    model.save(tmp_path)
+    os.replace(tmp_path, model_path)
+
+    # Mesmo protocolo de avaliação para todos os trials (limiar e penalidade
+    # padrão), senão trials com penalidades diferentes não seriam comparáveis
+    summary = summarize(evaluate_model(model, n_episodes=eval_episodes, n_envs=n_envs, seed=EVAL_SEED,
+                                       backend="subproc"))
+    return {"score": summary["mean_return"], "timesteps": model.num_timesteps, "summary": summary}
+
+
+class AshaSweep:
+    """Escalonador ASHA com estado persistido em `sweep_dir/sweep.json`."""
+
+    def __init__(self, sweep_dir, n_trials=32, min_timesteps=50_000, max_timesteps=800_000, eta=3, seed=0):
+        self.sweep_dir = sweep_dir
+        self.state_path = os.path.join(sweep_dir, STATE_FILENAME)
+        os.makedirs(sweep_dir, exist_ok=True)
+        if os.path.exists(self.state_path):
+            with open(self.state_path) as f:
+                self.state = json.load(f)
+            print(f"Retomando busca com {len(self.state['trials'])} trials de {self.state_path}")
+        else:
+            self.state = {
+                "settings": {"n_trials": n_trials, "min_timesteps": min_timesteps, "max_timesteps": max_timesteps,
+                             "eta": eta, "seed": seed},
+                "trials": {},
+            }
+        settings = self.state["settings"]
+        self.eta = settings["eta"]
+        self.budgets = rung_budgets(settings["min_timesteps"], settings["max_timesteps"], self.eta)
+        self.running = set()
+
+    def save(self):
+        save_json_atomic(self.state, self.state_path)
+
+    def _completed(self, trial_id):
+        return len(self.state["trials"][trial_id]["rungs"])
+
+    def next_job(self):
+        """(trial_id, degrau) do próximo trabalho, ou None se nada pode rodar agora."""
+        trials = self.state["trials"]
+        # Trials iniciados e não concluídos (busca interrompida) recomeçam o degrau 0
+        for trial_id in trials:
+            if not trials[trial_id]["rungs"] and trial_id not in self.running:
+                return trial_id, 0
+        # Promoção: do degrau mais alto para o mais baixo, o melhor 1/eta de cada degrau sobe
+        for rung in reversed(range(len(self.budgets) - 1)):
+            finished = [tid for tid in trials if str(rung) in trials[tid]["rungs"]]
+            finished.sort(key=lambda tid: trials[tid]["rungs"][str(rung)]["score"], reverse=True)
+            for trial_id in finished[:len(finished) // self.eta]:
+                if self._completed(trial_id) == rung + 1 and trial_id not in self.running:
+                    return trial_id, rung + 1
+        # Trial novo, com a configuração sorteada de forma reprodutível pelo índice
+        if len(trials) < self.state["settings"]["n_trials"]:
+            index = len(trials)
+            trial_id = f"trial_{index:03d}"
+            rng = np.random.default_rng([self.state["settings"]["seed"], index])
+            trials[trial_id] = {"config": sample_config(rng), "rungs": {}}
+            self.save()
+            return trial_id, 0
+        return None
+
+    def run(self, total_cores, cores_per_trial, eval_episodes=5):
+        from config import TRACK_CACHE
+        from track_cache import ensure_track_pool
+
+        if TRACK_CACHE is not None:
+            # Gerado uma vez aqui: trials simultâneos não disputam a escrita do arquivo
+            ensure_track_pool(TRACK_CACHE["path"], TRACK_CACHE["pool_size"])
+        n_workers = max(1, total_cores // cores_per_trial)
+        print(f"{n_workers} trials em paralelo, {cores_per_trial} núcleos cada; degraus: {self.budgets}")
+
+        futures = {}
+        ctx = mp.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=ctx, max_tasks_per_child=1) as executor:
+            while True:
+                while len(futures) < n_workers:
+                    job = self.next_job()
+                    if job is None:
+                        break
+                    trial_id, rung = job
+                    trial = self.state["trials"][trial_id]
+                    trial_dir = os.path.join(self.sweep_dir, trial_id)
+                    os.makedirs(trial_dir, exist_ok=True)
+                    future = executor.submit(run_trial_rung, trial_dir, trial["config"], self.budgets[rung],
+                                             cores_per_trial, eval_episodes, int(trial_id.split("_")[1]))
+                    futures[future] = job
+                    self.running.add(trial_id)
+                if not futures:
+                    break
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    trial_id, rung = futures.pop(future)
+                    self.running.discard(trial_id)
+                    result = future.result()
+                    self.state["trials"][trial_id]["rungs"][str(rung)] = result
+                    self.save()
+                    print(f"{trial_id} degrau {rung} ({result['timesteps']} passos): "
+                          f"recompensa média {result['score']:.1f}", flush=True)
+        return self.leaderboard()
+
+    def leaderboard(self):
+        # Quem chegou mais longe primeiro; dentro do mesmo degrau, pela nota
+        rows = []
+        for trial_id, trial in self.state["trials"].items():
+            if not trial["rungs"]:
+                continue
+            rung = max(map(int, trial["rungs"]))
+            result = trial["rungs"][str(rung)]
+            rows.append({"trial": trial_id, "rung": rung, "timesteps": result["timesteps"],
+                         "score": result["score"], "config": trial["config"]})
+        rows.sort(key=lambda row: (row["rung"], row["score"]), reverse=True)
+        save_json_atomic(rows, os.path.join(self.sweep_dir, LEADERBOARD_FILENAME))
+        return rows
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Busca de hiperparâmetros em paralelo com ASHA (retomável).")
+    parser.add_argument("name", help=f"Nome da busca (diretório em {SWEEPS_DIR})")
+    parser.add_argument("--trials", type=int, default=32)
+    parser.add_argument("--min-timesteps", type=int, default=50_000, help="Orçamento do primeiro degrau")
+    parser.add_argument("--max-timesteps", type=int, default=800_000, help="Orçamento máximo de um trial")
+    parser.add_argument("--eta", type=int, default=3, help="Fator de redução entre degraus")
+    parser.add_argument("--cores", type=int, default=os.cpu_count() or 4, help="Orçamento total de núcleos")
+    parser.add_argument("--cores-per-trial", type=int, default=4, help="Núcleos (= ambientes) por trial")
+    parser.add_argument("--eval-episodes", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    sweep = AshaSweep(os.path.join(SWEEPS_DIR, args.name), n_trials=args.trials, min_timesteps=args.min_timesteps,
+                      max_timesteps=args.max_timesteps, eta=args.eta, seed=args.seed)
+    leaderboard = sweep.run(args.cores, args.cores_per_trial, args.eval_episodes)
+    for row in leaderboard[:5]:
+        print(f"{row['trial']}: degrau {row['rung']}, {row['timesteps']} passos, "
+              f"recompensa média {row['score']:.1f} | {row['config']}")
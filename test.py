@@ -109,56 +109,46 @@
 # ===================================================================
 
 import gymnasium as gym
-from gymnasium.core import Wrapper
-import numpy as np
 from stable_baselines3 import PPO
 from stable_baselines3.common.env_util import make_vec_env
 from stable_baselines3.common.vec_env import VecFrameStack
 
 # --- Custom Wrapper para Terminar o Episódio na Grama ---
-# Este wrapper DEVE ser idêntico ao usado no treinamento para consistência.
-class CustomCarRacingWrapper(Wrapper):
-    def __init__(self, env):
-        super().__init__(env)
-        self.env = env
-        self.last_reward_raw = 0
-
-    def step(self, action):
-        step_result = self.env.step(action)
-
-        if len(step_result) == 5:
-            obs, reward, terminated, truncated, info = step_result
-        elif len(step_result) == 4:
-            obs, reward, terminated, info = step_result # 'terminated' aqui é o antigo 'done'
-            truncated = False # Assume truncated como False se a API for a antiga
-        else:
-            raise ValueError(f"O método step() do ambiente base retornou um número inesperado de valores: {len(step_result)}")
-
-        # --- Lógica de Término Imediato na Grama ---
-        green_pixels = (obs[:, :, 1] > 180) & (obs[:, :, 0] < 100) & (obs[:, :, 2] < 100)
-        num_green_pixels = np.sum(green_pixels)
-
-        GRASS_PIXEL_THRESHOLD = 500
-        OFF_TRACK_PENALTY = -1000
-
-        if num_green_pixels > GRASS_PIXEL_THRESHOLD:
-            reward = OFF_TRACK_PENALTY
-            terminated = True
-            info['off_track_by_grass'] = True
-
-        self.last_reward_raw = reward
-        return obs, float(reward), terminated, truncated, info
-
-    def reset(self, **kwargs):
-        return self.env.reset(**kwargs)
+# Importado do car_racing_env para garantir que seja idêntico ao usado no treinamento.
+from car_racing_env import CustomCarRacingWrapper
+from config import ACTION_REPEAT, NATIVE_RENDER, PREPROCESSING
+
+# Renderização nativa, pré-processamento, gravação e modelos .pt são importados
+# só quando usados: o teste de um .zip comum não carrega nem depende deles.
+
+# "pixel" (heurística de cor) ou "contact" (contato das rodas com a pista, via Box2D).
+# Com a renderização nativa do treinamento só o "contact" funciona.
+# A repetição de ações (ACTION_REPEAT) é a mesma do treinamento.
+OFF_TRACK_DETECTION = "pixel" if NATIVE_RENDER is None else "contact"
+# Diretório para gravar as trajetórias do teste (trajectory_recorder.py); None = não grava
+RECORD_DIR = None
 
 # --- Configuração do Ambiente de Teste ---
 def make_env_with_wrappers_for_test():
     env = gym.make("CarRacing-v3", continuous=True, render_mode="human")
-    env = CustomCarRacingWrapper(env)
+    if NATIVE_RENDER is not None:
+        from native_render import LowResRenderWrapper
+
+        # Observação igual à do treinamento, mas a janela continua com o render original
+        env = LowResRenderWrapper(env, **{**NATIVE_RENDER, "skip_render": False})
+    env = CustomCarRacingWrapper(env, off_track_detection=OFF_TRACK_DETECTION, action_repeat=ACTION_REPEAT)
+    if RECORD_DIR is not None:
+        from trajectory_recorder import TrajectoryRecorder
+
+        env = TrajectoryRecorder(env, RECORD_DIR)
     return env
 
 eval_env_base = make_vec_env(make_env_with_wrappers_for_test, n_envs=1)
+if PREPROCESSING is not None:
+    from preprocessing import apply_preprocessing
+
+    # O mesmo pré-processamento do treinamento, senão o modelo recebe outro formato de observação
+    eval_env_base = apply_preprocessing(eval_env_base, PREPROCESSING)
 eval_env_final = VecFrameStack(eval_env_base, n_stack=4)
 
 
@@ -168,8 +158,15 @@ try:
     # model_path = "./car_racing_ppo_final_model_colab_academico.zip"
     model_path = "./car_racing_model_400000_steps.zip"
     # model_path = "./car_racing_model_800000_steps.zip"
+    # model_path = "./car_racing_model_400000_steps.pt" # Exportado com: python inference.py <modelo>.zip
+
+    if model_path.endswith(".pt"):
+        from inference import InferenceEngine
 
-    model = PPO.load(model_path)
+        # Módulo exportado pelo inference.py: mesmo predict, sem a maquinaria do SB3
+        model = InferenceEngine(model_path)
+    else:
+        model = PPO.load(model_path)
     print(f"Modelo carregado com sucesso de: {model_path}")
 except FileNotFoundError:
     print(f"Erro: Modelo não encontrado em {model_path}. Verifique se o caminho e o nome do arquivo estão corretos.")
@@ -0,0 +1,131 @@
+import hashlib
+import json
+import multiprocessing as mp
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from checkpoint_files import checkpoint_steps, list_checkpoints, save_json_atomic
+from config import (ACTION_REPEAT, CHECKPOINT_DIR, CHECKPOINT_PREFIX, GRASS_DETECTION, N_STACK, NATIVE_RENDER,
+                    PREPROCESSING)
+from evaluate import EVAL_EPISODES, EVAL_SEED, evaluate_model, summarize
+from grass_detection import GRASS_PIXEL_THRESHOLD, OFF_TRACK_PENALTY, OFF_TRACK_WHEEL_THRESHOLD
+
+# --- Torneio de checkpoints ---
+# Avalia todos os checkpoints salvos pelo treinamento, guarda cada
+# resultado num cache indexado pelo hash do conteúdo do arquivo (renomear ou
+# copiar um checkpoint não força nova avaliação) e monta um ranking.
+CACHE_FILENAME = "tournament_cache.json"
+LEADERBOARD_FILENAME = "leaderboard.json"
+BEST_LINK_NAME = "best_model.zip"
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def evaluation_settings(envs_per_worker):
+    # Tudo o que muda as notas além do checkpoint, dos episódios e da semente:
+    # o número de ambientes muda a divisão dos episódios entre as sementes
+    return {
+        "envs_per_worker": envs_per_worker,
+        "grass_detection": GRASS_DETECTION,
+        "grass_pixel_threshold": GRASS_PIXEL_THRESHOLD,
+        "off_track_wheel_threshold": OFF_TRACK_WHEEL_THRESHOLD,
+        "off_track_penalty": OFF_TRACK_PENALTY,
+        "preprocessing": PREPROCESSING,
+        "native_render": NATIVE_RENDER,
+        "action_repeat": ACTION_REPEAT,
+        "n_stack": N_STACK,
+    }
+
+
+def cache_key(sha256, n_episodes, seed, settings):
+    # O protocolo de avaliação faz parte da chave: mudar qualquer parte dele reavalia
+    settings_hash = hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:16]
+    return f"{sha256}:{n_episodes}:{seed}:{settings_hash}"
+
+
+def load_cache(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _evaluate_checkpoint(path, n_episodes, n_envs, seed):
+    # Cada checkpoint roda num processo do pool, com seus ambientes em série
+    # (backend "dummy"): o paralelismo vem de avaliar vários checkpoints ao mesmo tempo.
+    import torch
+
+    torch.set_num_threads(1) # Evita que os workers disputem os núcleos com threads do torch
+    episodes = evaluate_model(path, n_episodes=n_episodes, n_envs=n_envs, seed=seed, backend="dummy")
+    return summarize(episodes)
+
+
+def update_best_link(models_dir, best_path):
+    link_path = os.path.join(models_dir, BEST_LINK_NAME)
+    tmp_link = f"{link_path}.tmp"
+    if os.path.lexists(tmp_link):
+        os.remove(tmp_link)
+    os.symlink(os.path.basename(best_path), tmp_link)
+    os.replace(tmp_link, link_path)
+    return link_path
+
+
+def run_tournament(models_dir=CHECKPOINT_DIR, n_episodes=EVAL_EPISODES, seed=EVAL_SEED, n_workers=None,
+                   envs_per_worker=2, name_prefix=CHECKPOINT_PREFIX):
+    checkpoints = list_checkpoints(models_dir, name_prefix)
+    if not checkpoints:
+        raise FileNotFoundError(f"Nenhum checkpoint encontrado em {models_dir}")
+
+    cache_path = os.path.join(models_dir, CACHE_FILENAME)
+    cache = load_cache(cache_path)
+    settings = evaluation_settings(envs_per_worker)
+    keys = {path: cache_key(file_sha256(path), n_episodes, seed, settings) for path in checkpoints}
+    pending = [path for path in checkpoints if keys[path] not in cache]
+    print(f"{len(checkpoints)} checkpoints, {len(checkpoints) - len(pending)} já no cache, {len(pending)} a avaliar")
+
+    if pending:
+        n_workers = n_workers or max(1, (os.cpu_count() or 1) // envs_per_worker)
+        ctx = mp.get_context("forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn")
+        with ProcessPoolExecutor(max_workers=min(n_workers, len(pending)), mp_context=ctx) as executor:
+            futures = {path: executor.submit(_evaluate_checkpoint, path, n_episodes, envs_per_worker, seed)
+                       for path in pending}
+            for path, future in futures.items():
+                cache[keys[path]] = future.result()
+                # Salva a cada resultado: um torneio interrompido não perde o que já rodou
+                save_json_atomic(cache, cache_path)
+                print(f"  {os.path.basename(path)}: {cache[keys[path]]['mean_return']:.2f}")
+
+    leaderboard = [
+        {"checkpoint": os.path.basename(path), "steps": checkpoint_steps(path), **cache[keys[path]]}
+        for path in checkpoints
+    ]
+    leaderboard.sort(key=lambda entry: entry["mean_return"], reverse=True)
+    save_json_atomic(leaderboard, os.path.join(models_dir, LEADERBOARD_FILENAME))
+    update_best_link(models_dir, leaderboard[0]["checkpoint"])
+    return leaderboard
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Avalia e ranqueia todos os checkpoints de um treinamento.")
+    parser.add_argument("--models-dir", default=CHECKPOINT_DIR)
+    parser.add_argument("--episodes", type=int, default=EVAL_EPISODES)
+    parser.add_argument("--seed", type=int, default=EVAL_SEED)
+    parser.add_argument("--workers", type=int, default=None, help="Checkpoints avaliados em paralelo")
+    parser.add_argument("--envs-per-worker", type=int, default=2)
+    args = parser.parse_args()
+
+    leaderboard = run_tournament(args.models_dir, n_episodes=args.episodes, seed=args.seed,
+                                 n_workers=args.workers, envs_per_worker=args.envs_per_worker)
+    print(f"\n{'#':>3}  {'checkpoint':<40} {'média':>9} {'desvio':>8} {'fora da pista':>14}")
+    for rank, entry in enumerate(leaderboard, start=1):
+        print(f"{rank:>3}  {entry['checkpoint']:<40} {entry['mean_return']:9.2f} {entry['std_return']:8.2f} "
+              f"{entry['off_track_rate']:14.0%}")
+    print(f"\nMelhor modelo: {leaderboard[0]['checkpoint']} -> {os.path.join(args.models_dir, BEST_LINK_NAME)}")
@@ -0,0 +1,206 @@
+import math
+import os
+
+import gymnasium as gym
+import numpy as np
+from gymnasium.core import Wrapper
+from gymnasium.envs.box2d.car_racing import BORDER, BORDER_MIN_COUNT, TRACK_TURN_RATE, TRACK_WIDTH
+
+# --- Cache de pistas pré-geradas ---
+# Cada reset do CarRacing sorteia uma pista nova: um laço em Python gera a
+# geometria (com tentativas descartadas quando a pista não fecha) antes de
+# criar os tiles no Box2D. Com o término na grama os episódios são curtos e
+# os resets frequentes, então geramos um pool de geometrias uma vez, guardamos
+# num .npz compacto e, no reset, só reconstruímos os tiles a partir do pool.
+TRACK_CACHE_PATH = "./track_cache.npz"
+DEFAULT_POOL_SIZE = 512
+
+
+def compute_border(track):
+    # Mesma regra do CarRacing para as zebras vermelho/branco nas curvas fortes
+    border = [False] * len(track)
+    for i in range(len(track)):
+        good = True
+        oneside = 0
+        for neg in range(BORDER_MIN_COUNT):
+            beta1 = track[i - neg - 0][1]
+            beta2 = track[i - neg - 1][1]
+            good &= abs(beta1 - beta2) > TRACK_TURN_RATE * 0.2
+            oneside += np.sign(beta1 - beta2)
+        good &= abs(oneside) == BORDER_MIN_COUNT
+        border[i] = good
+    for i in range(len(track)):
+        for neg in range(BORDER_MIN_COUNT):
+            border[i - neg] |= border[i]
+    return np.array(border, dtype=bool)
+
+
+def build_track_from_cache(car_racing, track, border):
+    """
+    Substituto do CarRacing._create_track: recria tiles e polígonos da pista
+    a partir de uma geometria já gerada, sem o laço de geração.
+    """
+    car_racing.start_alpha = 2 * math.pi * (-0.5) / 12
+    car_racing.road = []
+    track = [tuple(point) for point in np.asarray(track).tolist()]
+    for i in range(len(track)):
+        alpha1, beta1, x1, y1 = track[i]
+        alpha2, beta2, x2, y2 = track[i - 1]
+        road1_l = (x1 - TRACK_WIDTH * math.cos(beta1), y1 - TRACK_WIDTH * math.sin(beta1))
+        road1_r = (x1 + TRACK_WIDTH * math.cos(beta1), y1 + TRACK_WIDTH * math.sin(beta1))
+        road2_l = (x2 - TRACK_WIDTH * math.cos(beta2), y2 - TRACK_WIDTH * math.sin(beta2))
+        road2_r = (x2 + TRACK_WIDTH * math.cos(beta2), y2 + TRACK_WIDTH * math.sin(beta2))
+        vertices = [road1_l, road1_r, road2_r, road2_l]
+        car_racing.fd_tile.shape.vertices = vertices
+        t = car_racing.world.CreateStaticBody(fixtures=car_racing.fd_tile)
+        t.userData = t
+        c = 0.01 * (i % 3) * 255
+        t.color = car_racing.road_color + c
+        t.road_visited = False
+        t.road_friction = 1.0
+        t.idx = i
+        t.fixtures[0].sensor = True
+        car_racing.road_poly.append(([road1_l, road1_r, road2_r, road2_l], t.color))
+        car_racing.road.append(t)
+        if border[i]:
+            side = np.sign(beta2 - beta1)
+            b1_l = (x1 + side * TRACK_WIDTH * math.cos(beta1), y1 + side * TRACK_WIDTH * math.sin(beta1))
+            b1_r = (x1 + side * (TRACK_WIDTH + BORDER) * math.cos(beta1),
+                    y1 + side * (TRACK_WIDTH + BORDER) * math.sin(beta1))
+            b2_l = (x2 + side * TRACK_WIDTH * math.cos(beta2), y2 + side * TRACK_WIDTH * math.sin(beta2))
+            b2_r = (x2 + side * (TRACK_WIDTH + BORDER) * math.cos(beta2),
+                    y2 + side * (TRACK_WIDTH + BORDER) * math.sin(beta2))
+            car_racing.road_poly.append(
+                ([b1_l, b1_r, b2_r, b2_l], (255, 255, 255) if i % 2 == 0 else (255, 0, 0))
+            )
+    car_racing.track = track
+    return True
+
+
+def generate_track_pool(pool_size=DEFAULT_POOL_SIZE, first_seed=0):
+    env = gym.make("CarRacing-v3", continuous=True)
+    pool = {}
+    for seed in range(first_seed, first_seed + pool_size):
+        env.reset(seed=seed)
+        track = np.array(env.unwrapped.track, dtype=np.float64)
+        pool[seed] = (track, compute_border(track))
+    env.close()
+    return pool
+
+
+def save_track_pool(pool, path=TRACK_CACHE_PATH):
+    # Formato compacto: todas as pistas concatenadas mais os offsets de cada uma
+    seeds = np.array(sorted(pool), dtype=np.int64)
+    lengths = [len(pool[seed][0]) for seed in seeds]
+    tmp_path = f"{path}.tmp.npz"
+    np.savez_compressed(
+        tmp_path,
+        seeds=seeds,
+        offsets=np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64),
+        tracks=np.concatenate([pool[seed][0] for seed in seeds]),
+        borders=np.concatenate([pool[seed][1] for seed in seeds]),
+    )
+    os.replace(tmp_path, path)
+
+
+def load_track_pool(path=TRACK_CACHE_PATH):
+    with np.load(path) as data:
+        seeds, offsets, tracks, borders = data["seeds"], data["offsets"], data["tracks"], data["borders"]
+    return {
+        int(seed): (tracks[start:stop], borders[start:stop])
+        for seed, start, stop in zip(seeds, offsets[:-1], offsets[1:])
+    }
+
+
+def ensure_track_pool(path=TRACK_CACHE_PATH, pool_size=DEFAULT_POOL_SIZE):
+    # Gera o arquivo uma única vez, no processo principal, antes de criar os workers
+    if not os.path.exists(path):
+        print(f"Gerando pool de {pool_size} pistas em {path}...")
+        save_track_pool(generate_track_pool(pool_size), path)
+    return path
+
+
+class TrackCacheWrapper(Wrapper):
+    """
+    Faz o reset do CarRacing usar pistas do pool em vez de gerar uma nova.
+
+    A cada `refresh_every` resets, um reset gera uma pista nova do jeito
+    normal (com semente nova) e ela entra no pool no lugar de outra, escolhida
+    por `eviction` ("fifo": a mais antiga; "random": uma qualquer). Assim a
+    diversidade de pistas continua crescendo ao longo do treino.
+
+    A renovação vale só para a memória deste ambiente, durante esta execução:
+    o .npz em disco não é regravado (vários workers o compartilham) e cada
+    treino começa do mesmo pool. Para um pool novo, rode `python track_cache.py`.
+    """
+
+    def __init__(self, env, path=TRACK_CACHE_PATH, refresh_every=50, eviction="fifo"):
+        super().__init__(env)
+        if eviction not in ("fifo", "random"):
+            raise ValueError(f"Política de remoção desconhecida: {eviction}")
+        self.pool = load_track_pool(path)
+        self._order = list(self.pool) # Ordem de inserção, para a remoção FIFO
+        self.refresh_every = refresh_every
+        self.eviction = eviction
+        self._rng = np.random.default_rng()
+        self._resets = 0
+
+    def _refresh(self, options):
+        # Reset normal com semente nova; a pista gerada entra no pool
+        new_seed = int(self._rng.integers(2**31))
+        obs, info = self.env.reset(seed=new_seed, options=options)
+        if new_seed not in self.pool:
+            if self.eviction == "fifo":
+                evicted = self._order.pop(0)
+            else:
+                evicted = self._order.pop(int(self._rng.integers(len(self._order))))
+            del self.pool[evicted]
+            track = np.array(self.env.unwrapped.track, dtype=np.float64)
+            self.pool[new_seed] = (track, compute_border(track))
+            self._order.append(new_seed)
+        return obs, info
+
+    def reset(self, *, seed=None, options=None):
+        if seed is not None:
+            self._rng = np.random.default_rng(seed)
+        self._resets += 1
+        if self.refresh_every and self._resets % self.refresh_every == 0:
+            return self._refresh(options)
+
+        track_seed = self._order[int(self._rng.integers(len(self._order)))]
+        track, border = self.pool[track_seed]
+        car_racing = self.env.unwrapped
+        car_racing._create_track = lambda: build_track_from_cache(car_racing, track, border)
+        try:
+            obs, info = self.env.reset(seed=seed, options=options)
+        finally:
+            del car_racing._create_track
+        info["track_seed"] = track_seed
+        return obs, info
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Gera o pool de pistas e compara o custo do reset com e sem cache.")
+    parser.add_argument("--path", default=TRACK_CACHE_PATH)
+    parser.add_argument("--pool-size", type=int, default=DEFAULT_POOL_SIZE)
+    parser.add_argument("--n-resets", type=int, default=50)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    save_track_pool(generate_track_pool(args.pool_size), args.path)
+    print(f"Pool de {args.pool_size} pistas salvo em {args.path} ({os.path.getsize(args.path) / 2**20:.1f} MiB, "
+          f"{time.perf_counter() - start:.1f} s)")
+
+    for name, cached in (("sem cache", False), ("com cache", True)):
+        env = gym.make("CarRacing-v3", continuous=True)
+        if cached:
+            env = TrackCacheWrapper(env, args.path, refresh_every=0)
+        env.reset(seed=0)
+        start = time.perf_counter()
+        for _ in range(args.n_resets):
+            env.reset()
+        print(f"{name}: {(time.perf_counter() - start) / args.n_resets * 1e3:.2f} ms por reset")
+        env.close()
@@ -1,99 +1,109 @@
-import gymnasium as gym
-from gymnasium.core import Wrapper
-import numpy as np
-from stable_baselines3 import PPO
-from stable_baselines3.common.env_util import make_vec_env
-from stable_baselines3.common.callbacks import CheckpointCallback
+from functools import partial
+
+from stable_baselines3.common.callbacks import CallbackList
 from stable_baselines3.common.vec_env import VecFrameStack
 
-#teste
-class CustomCarRacingWrapper(Wrapper):
-    def __init__(self, env):
-        super().__init__(env)
-        self.env = env
-        self.last_reward_raw = 0
-
-    def step(self, action):
-        # Captura o resultado do step do ambiente base
-        step_result = self.env.step(action)
-
-        # Adapta-se à API do Gymnasium (4 ou 5 valores)
-        if len(step_result) == 5:
-            obs, reward, terminated, truncated, info = step_result
-        elif len(step_result) == 4:
-            obs, reward, terminated, info = step_result # 'terminated' aqui é o antigo 'done'
-            truncated = False # Assume truncated como False se a API for a antiga
+from car_racing_env import make_training_vec_env, rollout_buffer_config
+from checkpoint_files import find_latest_checkpoint
+from checkpointing import AsyncCheckpointCallback
+from config import (CHECKPOINT_DIR, CHECKPOINT_PREFIX, CORE_SCHEDULING, LEARNER_CORES, N_ENV_GROUPS, N_ENVS, N_STACK,
+                    PPO_HYPERPARAMS, RECORD_TRAJECTORIES, RESUME, ROLLOUT_MODE, SAVE_FREQ, TOTAL_TIMESTEPS)
+from instrumentation import PhaseTimingCallback
+from pipelined_rollout import PipelinedPPO, make_grouped_vec_env
+from resource_scheduler import affinity_supported, apply_plan, calibrate_plan, limit_worker_threads, plan_cores
+
+# As configurações ficam em config.py e o wrapper e as fábricas dos ambientes
+# em car_racing_env.py; este módulo só monta e roda o treinamento.
+
+
+def train(total_timesteps=TOTAL_TIMESTEPS, resume=RESUME):
+    core_scheduling = CORE_SCHEDULING
+    if core_scheduling is not None and not affinity_supported():
+        print(f"Aviso: CORE_SCHEDULING={core_scheduling!r} ignorado, sem afinidade de CPU neste sistema")
+        core_scheduling = None
+    if core_scheduling is not None:
+        # Workers com BLAS/OpenMP em uma thread; o learner recebe as threads do torch depois
+        limit_worker_threads(1)
+
+    # --- 1. Criação e Empilhamento dos Ambientes (car_racing_env.py) ---
+    # Só o treinamento grava trajetórias (RECORD_TRAJECTORIES)
+    make_env = partial(make_training_vec_env, record_dir=RECORD_TRAJECTORIES)
+    if ROLLOUT_MODE == "pipelined":
+        vec_env = make_grouped_vec_env(make_env, N_ENVS, N_ENV_GROUPS, N_STACK)
+    else:
+        vec_env = make_env()
+        vec_env = VecFrameStack(vec_env, n_stack=N_STACK)
+
+    # Workers e blocos de memória compartilhada são liberados mesmo se o treino
+    # falhar ou for interrompido (Ctrl+C)
+    try:
+        # --- 2. Criação do Modelo PPO ---
+        rollout_buffer_class, rollout_buffer_kwargs = rollout_buffer_config()
+
+        resume_path, _ = find_latest_checkpoint(CHECKPOINT_DIR, CHECKPOINT_PREFIX) if resume else (None, 0)
+        if resume_path is not None:
+            # O load descarta a última observação salva e força um reset dos ambientes novos
+            model = PipelinedPPO.load(resume_path, env=vec_env, tensorboard_log="./car_racing_ppo_tensorboard/")
+            print(f"Retomando de {resume_path} ({model.num_timesteps} passos)")
         else:
-            raise ValueError(f"O método step() do ambiente base retornou um número inesperado de valores: {len(step_result)}")
-
-        # --- Lógica de Término Imediato na Grama ---
-        # Heurística para identificar pixels de grama:
-        green_pixels = (obs[:, :, 1] > 180) & (obs[:, :, 0] < 100) & (obs[:, :, 2] < 100)
-        num_green_pixels = np.sum(green_pixels)
-
-        # Se uma quantidade significativa de grama for detectada, termine o episódio
-        # O limiar (ex: 500 pixels) e a penalidade (-1000) podem ser ajustados.
-        GRASS_PIXEL_THRESHOLD = 500 # Quantidade de pixels de grama para considerar "fora da pista"
-        OFF_TRACK_PENALTY = -1000 # Penalidade severa por sair da pista
-
-        if num_green_pixels > GRASS_PIXEL_THRESHOLD:
-            reward = OFF_TRACK_PENALTY # Aplica uma penalidade alta
-            terminated = True         # Termina o episódio
-            # Opcional: Adicionar uma informação para depuração
-            info['off_track_by_grass'] = True
-
-        self.last_reward_raw = reward # Para depuração
-
-        # O 'float(reward)' é importante para garantir o tipo correto,
-        # pois o Stable Baselines3 espera recompensas como float.
-        return obs, float(reward), terminated, truncated, info
-
-    def reset(self, **kwargs):
-        return self.env.reset(**kwargs)
-
-# --- Configurações de Treinamento ---
-N_ENVS = 4
-TOTAL_TIMESTEPS = 2_400_000 # Lembre-se de aumentar isso para milhões para treinamento real
-SAVE_FREQ = 100000
-
-# --- 1. Criação e Empilhamento dos Ambientes ---
-def make_env_with_wrappers():
-    env = gym.make("CarRacing-v3", continuous=True, render_mode="rgb_array")
-    env = CustomCarRacingWrapper(env)
-    return env
-
-vec_env = make_vec_env(make_env_with_wrappers, n_envs=N_ENVS, seed=0)
-vec_env = VecFrameStack(vec_env, n_stack=4)
-
-# --- 2. Criação do Modelo PPO ---
-model = PPO("CnnPolicy", vec_env, verbose=1,
-            learning_rate=0.0003,
-            n_steps=2048,
-            batch_size=64,
-            n_epochs=10,
-            gamma=0.99,
-            gae_lambda=0.95,
-            clip_range=0.2,
-            ent_coef=0.01,
-            max_grad_norm=0.5,
-            tensorboard_log="./car_racing_ppo_tensorboard/")
-
-# --- 3. Callbacks ---
-checkpoint_callback = CheckpointCallback(
-    save_freq=SAVE_FREQ,
-    save_path="./car_racing_ppo_models/",
-    name_prefix="car_racing_model"
-)
-
-# --- 4. Treinamento ---
-print("Iniciando treinamento...")
-model.learn(total_timesteps=TOTAL_TIMESTEPS,
-            callback=checkpoint_callback)
-print("Treinamento concluído!")
-
-# --- 5. Salvar o Modelo Final ---
-model.save("car_racing_ppo_final_model")
-print("Modelo final salvo como car_racing_ppo_final_model.zip")
+            # PipelinedPPO usa a coleta padrão do PPO quando o VecEnv não é agrupado
+            model = PipelinedPPO("CnnPolicy", vec_env, verbose=1,
+                                 rollout_buffer_class=rollout_buffer_class, # Observações em uint8 no rollout
+                                 rollout_buffer_kwargs=rollout_buffer_kwargs,
+                                 tensorboard_log="./car_racing_ppo_tensorboard/",
+                                 **PPO_HYPERPARAMS)
+
+        if core_scheduling == "calibrate":
+            # VecEnv descartável com o mesmo número de workers: os passos da calibração não chegam ao treino
+            core_plan = calibrate_plan(partial(make_training_vec_env, n_envs=N_ENVS, record_dir=None), model)
+        elif core_scheduling == "static":
+            core_plan = plan_cores(LEARNER_CORES)
+        if core_scheduling is not None:
+            apply_plan(core_plan, vec_env)
+            print(f"Núcleos do learner: {core_plan['learner']} | núcleos dos ambientes: {core_plan['envs']}")
+
+        # --- 3. Callbacks ---
+        # Escreve os .zip em segundo plano; um SIGTERM salva um último checkpoint e para o treino
+        checkpoint_callback = AsyncCheckpointCallback(
+            save_freq=SAVE_FREQ,
+            save_path=CHECKPOINT_DIR,
+            name_prefix=CHECKPOINT_PREFIX
+        )
+        # Tempo por fase (simulação, grama, inferência, GAE, gradientes, checkpoints) no TensorBoard
+        timing_callback = PhaseTimingCallback(checkpoint_callback=checkpoint_callback)
+
+        # --- 4. Treinamento ---
+        remaining_timesteps = total_timesteps - model.num_timesteps
+        if remaining_timesteps > 0:
+            print("Iniciando treinamento...")
+            # Sem zerar o contador: os checkpoints e o TensorBoard continuam de onde pararam
+            model.learn(total_timesteps=remaining_timesteps,
+                        callback=CallbackList([checkpoint_callback, timing_callback]),
+                        reset_num_timesteps=resume_path is None)
+    finally:
+        vec_env.close()
+
+    # --- 5. Salvar o Modelo Final ---
+    if checkpoint_callback.preempted:
+        print(f"Treinamento interrompido em {model.num_timesteps} passos; rode de novo para retomar.")
+    else:
+        print("Treinamento concluído!")
+        model.save("car_racing_ppo_final_model")
+        print("Modelo final salvo como car_racing_ppo_final_model.zip")
+    return model
+
+
+# Importar este módulo não inicia um treino: o train() pode ser chamado de outros scripts.
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Treinamento do PPO no CarRacing (configurações em config.py).")
+    parser.add_argument("--total-timesteps", type=int, default=TOTAL_TIMESTEPS)
+    parser.add_argument("--resume", action="store_true", default=RESUME,
+                        help=f"Continua do checkpoint mais avançado em {CHECKPOINT_DIR}")
+    args = parser.parse_args()
+
+    train(total_timesteps=args.total_timesteps, resume=args.resume)
 
 # ======================================================================
 
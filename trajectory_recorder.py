@@ -0,0 +1,184 @@
+import glob
+import json
+import os
+import uuid
+
+import numpy as np
+from gymnasium.core import Wrapper
+
+# --- Gravação de trajetórias em disco (memory-mapped) ---
+# Cada TrajectoryRecorder escreve num subdiretório próprio (um por ambiente,
+# então funciona igual com DummyVecEnv ou com workers em outros processos).
+# As transições vão para chunks de tamanho fixo, arquivos .npy abertos com
+# np.memmap: a RAM usada é a das páginas sujas, não a do dataset. Um chunk
+# só entra no index.json depois de completo e descarregado em disco, então
+# um processo morto no meio do caminho deixa no máximo um chunk órfão, que
+# o leitor ignora.
+DEFAULT_CHUNK_SIZE = 4096
+INDEX_FILE = "index.json"
+FIELDS = ("obs", "actions", "rewards", "off_track", "terminated", "truncated")
+
+
+class TrajectoryRecorder(Wrapper):
+    """
+    Grava (obs, ação, recompensa, off_track_by_grass, terminated, truncated)
+    de cada passo; `obs` é a observação sobre a qual a ação foi escolhida.
+
+    Deve ficar por fora do CustomCarRacingWrapper para ver a recompensa com
+    a penalidade e o info['off_track_by_grass']. No modo "vec" a detecção de
+    grama acontece no VecGrassDetector, acima dos ambientes individuais, e
+    não apareceria aqui: o make_training_vec_env só aceita gravar com
+    "pixel" ou "contact".
+    """
+
+    def __init__(self, env, root, chunk_size=DEFAULT_CHUNK_SIZE):
+        super().__init__(env)
+        self.directory = os.path.join(root, f"{os.getpid()}_{uuid.uuid4().hex[:8]}")
+        os.makedirs(self.directory)
+        self.chunk_size = chunk_size
+        self._chunks = []
+        self._arrays = None
+        self._length = 0
+        self._last_obs = None
+
+    def _open_chunk(self):
+        path = os.path.join(self.directory, f"chunk_{len(self._chunks):05d}")
+        os.makedirs(path)
+        obs_space, action_space = self.observation_space, self.action_space
+        specs = {
+            "obs": (obs_space.shape, obs_space.dtype),
+            "actions": (action_space.shape, np.float32),
+            "rewards": ((), np.float32),
+            "off_track": ((), np.bool_),
+            "terminated": ((), np.bool_),
+            "truncated": ((), np.bool_),
+        }
+        self._arrays = {
+            name: np.lib.format.open_memmap(os.path.join(path, f"{name}.npy"), mode="w+", dtype=dtype,
+                                            shape=(self.chunk_size, *shape))
+            for name, (shape, dtype) in specs.items()
+        }
+        self._chunk_path = path
+        self._length = 0
+
+    def _close_chunk(self):
+        if self._arrays is None:
+            return
+        for array in self._arrays.values():
+            array.flush()
+        self._arrays = None
+        if self._length == 0:
+            return
+        self._chunks.append({"path": os.path.basename(self._chunk_path), "length": self._length})
+        index = {
+            "observation_shape": list(self.observation_space.shape),
+            "observation_dtype": str(np.dtype(self.observation_space.dtype)),
+            "action_shape": list(self.action_space.shape),
+            "chunks": self._chunks,
+        }
+        tmp_path = os.path.join(self.directory, f"{INDEX_FILE}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, os.path.join(self.directory, INDEX_FILE))
+
+    def reset(self, **kwargs):
+        obs, info = self.env.reset(**kwargs)
+        self._last_obs = obs
+        return obs, info
+
+    def step(self, action):
+        obs, reward, terminated, truncated, info = self.env.step(action)
+        if self._arrays is None:
+            self._open_chunk()
+        row = self._length
+        self._arrays["obs"][row] = self._last_obs
+        self._arrays["actions"][row] = action
+        self._arrays["rewards"][row] = reward
+        self._arrays["off_track"][row] = info.get("off_track_by_grass", False)
+        self._arrays["terminated"][row] = terminated
+        self._arrays["truncated"][row] = truncated
+        self._length += 1
+        if self._length == self.chunk_size:
+            self._close_chunk()
+        self._last_obs = obs
+        return obs, reward, terminated, truncated, info
+
+    def close(self):
+        self._close_chunk()
+        return super().close()
+
+
+class TrajectoryDataset:
+    """
+    Lê todos os chunks completos sob `root` (de todos os gravadores) e itera
+    minibatches embaralhados sem carregar o dataset na RAM.
+
+    O embaralhamento é em dois níveis: a ordem dos chunks é sorteada e, a
+    cada `chunks_in_memory` chunks abertos (por memmap), as transições
+    desses chunks são misturadas entre si. Dentro de um minibatch as linhas
+    de cada chunk são lidas em ordem crescente, para o acesso ao disco ser
+    sequencial.
+    """
+
+    def __init__(self, root):
+        self.chunks = []
+        for index_path in sorted(glob.glob(os.path.join(root, "*", INDEX_FILE))):
+            with open(index_path) as f:
+                index = json.load(f)
+            directory = os.path.dirname(index_path)
+            self.chunks.extend((os.path.join(directory, chunk["path"]), chunk["length"]) for chunk in index["chunks"])
+
+    def __len__(self):
+        return sum(length for _, length in self.chunks)
+
+    @staticmethod
+    def _open(path):
+        return {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in FIELDS}
+
+    def iter_minibatches(self, batch_size=256, chunks_in_memory=4, seed=None, drop_last=False):
+        rng = np.random.default_rng(seed)
+        order = rng.permutation(len(self.chunks))
+        for start in range(0, len(order), chunks_in_memory):
+            group = [self.chunks[i] for i in order[start:start + chunks_in_memory]]
+            arrays = [self._open(path) for path, _ in group]
+            # (chunk, linha) de todas as transições do grupo, embaralhadas juntas
+            keys = np.concatenate([
+                np.stack([np.full(length, chunk_idx), np.arange(length)], axis=1)
+                for chunk_idx, (_, length) in enumerate(group)
+            ])
+            keys = keys[rng.permutation(len(keys))]
+            for batch_start in range(0, len(keys), batch_size):
+                batch_keys = keys[batch_start:batch_start + batch_size]
+                if drop_last and len(batch_keys) < batch_size:
+                    break
+                yield self._gather(arrays, batch_keys)
+
+    @staticmethod
+    def _gather(arrays, batch_keys):
+        parts = {name: [] for name in FIELDS}
+        for chunk_idx in np.unique(batch_keys[:, 0]):
+            rows = np.sort(batch_keys[batch_keys[:, 0] == chunk_idx, 1])
+            for name in FIELDS:
+                parts[name].append(arrays[chunk_idx][name][rows])
+        return {name: np.concatenate(values) for name, values in parts.items()}
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Resumo de um diretório de trajetórias e vazão do leitor.")
+    parser.add_argument("root", help="Diretório passado ao TrajectoryRecorder")
+    parser.add_argument("--batch-size", type=int, default=256)
+    args = parser.parse_args()
+
+    dataset = TrajectoryDataset(args.root)
+    print(f"{len(dataset.chunks)} chunks, {len(dataset)} transições")
+    start = time.perf_counter()
+    n_transitions = off_track = 0
+    for batch in dataset.iter_minibatches(args.batch_size, seed=0):
+        n_transitions += len(batch["rewards"])
+        off_track += int(batch["off_track"].sum())
+    elapsed = time.perf_counter() - start
+    print(f"Leitura embaralhada: {n_transitions / max(elapsed, 1e-9):.0f} transições/s | "
+          f"saídas de pista: {off_track}")